@@ -0,0 +1,160 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+
+from normalizacion import normalizar_resultados
+
+# --- CONFIGURACIÓN ---
+OUTPUT_DIR    = "output_docai"
+RUTA_ALMACEN  = os.path.join(OUTPUT_DIR, "resultados.sqlite")
+
+
+class AlmacenResultados:
+    """
+    Almacén local (SQLite) de las filas extraídas, por cliente y proyecto.
+
+    Durante una ejecución cada factura se añade con un INSERT en lugar de
+    releer y reescribir el Excel completo; el Excel se genera una sola vez
+    al final con exportar_excel(). La columna 'Archivo' hace de clave: volver
+    a guardar un archivo sustituye sus filas manteniendo su posición.
+    """
+
+    def __init__(self, ruta: str = RUTA_ALMACEN):
+        if os.path.dirname(ruta):
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        # timeout: en modo --all varios procesos escriben en el mismo fichero
+        self._conn = sqlite3.connect(ruta, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS filas (
+                   cliente  TEXT NOT NULL,
+                   proyecto TEXT NOT NULL,
+                   archivo  TEXT NOT NULL,
+                   orden    INTEGER NOT NULL,
+                   sub      INTEGER NOT NULL,
+                   datos    TEXT NOT NULL,
+                   PRIMARY KEY (cliente, proyecto, archivo, sub)
+               )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_orden ON filas (cliente, proyecto, orden, sub)"
+        )
+        self._conn.commit()
+
+    def guardar(self, cliente: str, proyecto: str, filas: list[dict]) -> None:
+        """Añade o sustituye las filas de una o varias facturas."""
+        por_archivo = {}
+        for fila in filas:
+            por_archivo.setdefault(str(fila.get("Archivo", "")), []).append(fila)
+
+        with self._lock:
+            for archivo, filas_archivo in por_archivo.items():
+                previa = self._conn.execute(
+                    "SELECT MIN(orden) FROM filas WHERE cliente = ? AND proyecto = ? AND archivo = ?",
+                    (cliente, proyecto, archivo),
+                ).fetchone()[0]
+                if previa is None:
+                    previa = self._conn.execute(
+                        "SELECT COALESCE(MAX(orden) + 1, 0) FROM filas WHERE cliente = ? AND proyecto = ?",
+                        (cliente, proyecto),
+                    ).fetchone()[0]
+                self._conn.execute(
+                    "DELETE FROM filas WHERE cliente = ? AND proyecto = ? AND archivo = ?",
+                    (cliente, proyecto, archivo),
+                )
+                self._conn.executemany(
+                    "INSERT INTO filas VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (cliente, proyecto, archivo, previa, i,
+                         json.dumps(fila, ensure_ascii=False, default=str))
+                        for i, fila in enumerate(filas_archivo)
+                    ],
+                )
+            self._conn.commit()
+
+    def tiene_filas(self, cliente: str, proyecto: str) -> bool:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM filas WHERE cliente = ? AND proyecto = ? LIMIT 1",
+                (cliente, proyecto),
+            ).fetchone() is not None
+
+    def importar_excel(self, cliente: str, proyecto: str, ruta_excel: str) -> None:
+        """
+        Carga en el almacén un Excel generado antes de que existiera el almacén,
+        para que las nuevas filas se fusionen con las ya existentes.
+        """
+        if not os.path.exists(ruta_excel) or self.tiene_filas(cliente, proyecto):
+            return
+        import pandas as pd
+        df = pd.read_excel(ruta_excel).fillna("")
+        if "Archivo" in df.columns:
+            self.guardar(cliente, proyecto, df.to_dict("records"))
+
+    def dataframe(self, cliente: str, proyecto: str, columnas=None):
+        """DataFrame con las filas del cliente y proyecto, en orden."""
+        import pandas as pd
+        with self._lock:
+            filas = self._conn.execute(
+                "SELECT datos FROM filas WHERE cliente = ? AND proyecto = ? ORDER BY orden, sub",
+                (cliente, proyecto),
+            ).fetchall()
+        df = pd.DataFrame([json.loads(f[0]) for f in filas])
+        if columnas is not None:
+            df = df[[col for col in columnas if col in df.columns]]
+        return df
+
+    def todas(self):
+        """DataFrame con las filas de todos los clientes y proyectos (p. ej. para buscar duplicados)."""
+        import pandas as pd
+        with self._lock:
+            filas = self._conn.execute(
+                "SELECT datos FROM filas ORDER BY cliente, proyecto, orden, sub"
+            ).fetchall()
+        return pd.DataFrame([json.loads(f[0]) for f in filas])
+
+    def exportar_excel(self, cliente: str, proyecto: str, ruta_excel: str, columnas=None) -> None:
+        """Escribe el Excel con importes numéricos, fechas reales y CIF normalizados."""
+        import pandas as pd
+        df = normalizar_resultados(self.dataframe(cliente, proyecto, columnas))
+        with pd.ExcelWriter(ruta_excel, datetime_format="DD/MM/YYYY", date_format="DD/MM/YYYY") as excel:
+            df.to_excel(excel, index=False)
+
+    def proyectos(self) -> list[tuple[str, str]]:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT DISTINCT cliente, proyecto FROM filas ORDER BY cliente, proyecto"
+            ).fetchall()
+
+    def cerrar(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Exporta a Excel los resultados del almacén local")
+    parser.add_argument("--cliente", help="Nombre del cliente (carpeta raíz)")
+    parser.add_argument("--proyecto", help="Nombre del proyecto (subcarpeta)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    almacen = AlmacenResultados()
+    for cliente, proyecto in almacen.proyectos():
+        if args.cliente and cliente != args.cliente:
+            continue
+        if args.proyecto and proyecto != args.proyecto:
+            continue
+        ruta = os.path.join(OUTPUT_DIR, f"{cliente}_{proyecto}.xlsx")
+        almacen.exportar_excel(cliente, proyecto, ruta)
+        print(f"Exportado: {ruta}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,103 +1,227 @@
 import io
-import os
-import shutil
 import streamlit as st
 import pandas as pd
 import json
+import grpc
+import google.auth.transport.requests
 from google.oauth2 import service_account
 from google.cloud import documentai_v1 as documentai
-import re
+import hashlib
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from types import SimpleNamespace
+
+from cache_docai import CacheDocAI
+from texto_local import RutaLocal
+from flujo_docai import FlujoDocAI
+from metricas import Metricas
+from planificador_docai import PlanificadorDocAI
+from peticiones_docai import PAGINAS_EXTREMOS, PreparadorPeticiones
+from normalizacion import normalizar_resultados
+from extraccion import COLUMNAS_FACTURAS, extraer_campos, fila
+from cola_trabajos import ColaTrabajos, TERMINADO
 
 # --- CONFIGURACIÓN ---
 PROJECT_ID   = "772723410003"
 LOCATION     = "us"
 PROCESSOR_ID = "dff8117c158462cd"
+MAX_WORKERS  = 16    # Hilos de la cola: facturas procesadas a la vez entre todos los usuarios
+INTERVALO_SONDEO = 1.0      # Segundos entre consultas del progreso de un trabajo
+PAGINAS_POR_MINUTO = None   # Presupuesto de páginas/min de Document AI (None = sin límite)
+RECOMPRIMIR_PDFS = False    # Reducir las imágenes de los PDFs escaneados muy pesados antes de enviarlos
 
-# --- Autenticación con st.secrets ---
-info = json.loads(st.secrets["google"]["credentials"])
-creds = service_account.Credentials.from_service_account_info(info)
-docai_client = documentai.DocumentProcessorServiceClient(credentials=creds)
 processor_name = f"projects/{PROJECT_ID}/locations/{LOCATION}/processors/{PROCESSOR_ID}"
 
-def parse_float_es(valor: str) -> float:
-    if not valor:
-        return 0.0
-    limpia = re.sub(r"[^\d,\.]", "", valor).replace('.', '').replace(',', '.')
+# --- Autenticación con st.secrets ---
+@st.cache_resource
+def obtener_cliente_docai():
+    # Credenciales y cliente se crean una vez por proceso y los comparten todas
+    # las sesiones y reruns: el canal gRPC (HTTP/2, multiplexado) queda abierto
+    info = json.loads(st.secrets["google"]["credentials"])
+    creds = service_account.Credentials.from_service_account_info(info)
+    client = documentai.DocumentProcessorServiceClient(credentials=creds)
     try:
-        return float(limpia)
-    except ValueError:
-        return 0.0
+        # Calentar token y conexión para que el primer "Procesar" no los pague
+        creds.refresh(google.auth.transport.requests.Request())
+        grpc.channel_ready_future(client.transport.grpc_channel).result(timeout=10)
+    except Exception:
+        pass  # Si falla, la conexión se establecerá en la primera petición
+    return client
+
+docai_client = obtener_cliente_docai()
+
+@st.cache_resource
+def obtener_cache():
+    # Una sola caché por proceso, compartida por todas las sesiones
+    return CacheDocAI()
+
+cache = obtener_cache()
+
+@st.cache_resource
+def obtener_planificador():
+    # La cuota de Document AI es del proyecto: un único planificador para todas las sesiones
+    return PlanificadorDocAI(MAX_WORKERS, PAGINAS_POR_MINUTO)
 
-def procesar_factura_bytes(pdf_bytes, filename) -> dict:
+planificador = obtener_planificador()
+
+def nueva_ejecucion():
+    # Ruta local, páginas enviadas y métricas son de cada trabajo (los hilos de la
+    # cola atienden a varios a la vez); cliente, caché y planificador, de todos
+    return FlujoDocAI(processor_name, lambda: docai_client, planificador,
+                      PreparadorPeticiones(PAGINAS_EXTREMOS, RECOMPRIMIR_PDFS), Metricas(),
+                      cache=cache, ruta_local=RutaLocal())
+
+def extraer_datos(doc, filename) -> dict:
+    return fila(extraer_campos(doc), COLUMNAS_FACTURAS, filename)
+
+def procesar_factura_bytes(pdf_bytes, filename, flujo):
+    # Devuelve (lista de facturas, error): un PDF grande se divide y puede traer varias
     try:
-        raw_doc = documentai.RawDocument(content=pdf_bytes, mime_type="application/pdf")
-        req = documentai.ProcessRequest(name=processor_name, raw_document=raw_doc)
-        res = docai_client.process_document(request=req)
-        doc = res.document
-
-        datos = {
-            "Archivo": filename,
-            "Proveedor": "",
-            "Dirección": "",
-            "Teléfono": "",
-            "Nº Factura": "",
-            "Fecha Emisión": "",
-            "Nº Pedido": "",
-            "Base Imponible": "",
-            "IVA": "",
-            "Importe Total": "",
-            "CIF Proveedor": "",
-            "Concepto": []
-        }
-        for e in doc.entities:
-            text = e.mention_text or ""
-            t = e.type_
-            if t == "supplier_name":
-                datos["Proveedor"] = text
-            elif t == "supplier_address":
-                datos["Dirección"] = text
-            elif t == "supplier_phone":
-                datos["Teléfono"] = text
-            elif t == "supplier_tax_id":
-                datos["CIF Proveedor"] = text
-            elif t == "invoice_id":
-                datos["Nº Factura"] = text
-            elif t == "invoice_date":
-                datos["Fecha Emisión"] = text
-            elif t == "purchase_order":
-                datos["Nº Pedido"] = text
-            elif t == "net_amount":
-                valor = parse_float_es(text)
-                datos["Base Imponible"] = f"{valor:.2f}".replace('.', ',')
-            elif t == "total_tax_amount":
-                valor = parse_float_es(text)
-                datos["IVA"] = f"{valor:.2f}".replace('.', ',')
-            elif t == "total_amount":
-                datos["Importe Total"] = text
-            elif t == "line_item":
-                for p in e.properties:
-                    if p.type_.endswith("description"):
-                        datos["Concepto"].append(p.mention_text or "")
-        datos["Concepto"] = " | ".join(filter(None, datos["Concepto"]))
-        return datos, None
+        facturas = []
+        documentos = flujo.documentos(pdf_bytes)
+        with flujo.metricas.etapa("extraccion"):
+            for paginas, doc in documentos:
+                datos = extraer_datos(doc, filename)
+                if paginas:
+                    datos["Páginas"] = paginas
+                facturas.append(datos)
+        return facturas, None
     except Exception as e:
         return None, f"{filename}: {e}"
 
+# --- Exportación de resultados ---
+FORMATOS_EXPORTACION = {
+    "xlsx": ("⬇️ Descargar Excel",
+             "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+             lambda df, buf: df.to_excel(buf, index=False, engine="openpyxl")),
+    "csv": ("⬇️ Descargar CSV", "text/csv",
+            # utf-8-sig para que Excel abra bien las tildes
+            lambda df, buf: df.to_csv(buf, index=False, encoding="utf-8-sig")),
+    "parquet": ("⬇️ Descargar Parquet", "application/vnd.apache.parquet",
+                # Importes, fechas y 'Cuadra' conservan su tipo; el resto, como texto
+                lambda df, buf: df.astype({c: str for c in df.columns if df[c].dtype == object})
+                                  .to_parquet(buf, index=False)),
+}
+MAX_EXPORTACIONES = 16   # Ficheros exportados que se guardan en memoria
+
+@st.cache_resource
+def obtener_exportaciones():
+    # Bytes ya exportados por (clave del resultado, formato), compartidos entre reruns
+    return OrderedDict(), threading.Lock()
+
+def clave_resultados(df) -> str:
+    """Huella del DataFrame de resultados (contenido y columnas)."""
+    h = hashlib.sha256(pd.util.hash_pandas_object(df.astype(str), index=True).values.tobytes())
+    h.update("|".join(map(str, df.columns)).encode("utf-8"))
+    return h.hexdigest()
+
+def exportar_resultados(df, clave, formato) -> bytes:
+    exportaciones, lock = obtener_exportaciones()
+    with lock:
+        if (clave, formato) in exportaciones:
+            exportaciones.move_to_end((clave, formato))
+            return exportaciones[(clave, formato)]
+    buffer = io.BytesIO()
+    FORMATOS_EXPORTACION[formato][2](df, buffer)
+    datos = buffer.getvalue()
+    with lock:
+        exportaciones[(clave, formato)] = datos
+        while len(exportaciones) > MAX_EXPORTACIONES:
+            exportaciones.popitem(last=False)
+    return datos
+
+# --- Cola de trabajos ---
+def terminar_trabajo(trabajo):
+    # Lo ejecuta el hilo que acaba el último archivo: tabla normalizada y métricas del trabajo
+    flujo = trabajo.contexto
+    filas = trabajo.filas()
+    df = clave = None
+    if filas:
+        with flujo.metricas.etapa("normalizacion"):
+            df = normalizar_resultados(pd.DataFrame(filas))
+        clave = clave_resultados(df)
+    flujo.metricas.sumar("facturas_procesadas", len(filas))
+    flujo.metricas.sumar("errores", len(trabajo.errores))
+    # La caché y el planificador son de todos los trabajos: solo figuran en los resúmenes
+    flujo.sumar_contadores(compartidas=False)
+    return SimpleNamespace(df=df, clave=clave, metricas=flujo.metricas.resumen(),
+                           resumenes=flujo.resumenes())
+
+@st.cache_resource
+def obtener_cola():
+    # Una cola por proceso: sus hilos atienden por turnos los trabajos de todas las sesiones
+    return ColaTrabajos(procesar_factura_bytes, MAX_WORKERS,
+                        crear_contexto=nueva_ejecucion, al_terminar=terminar_trabajo)
+
+cola = obtener_cola()
+
+def sesion_actual() -> str:
+    # Identificador de la sesión en la URL (?sesion=…): recargar la página o
+    # volver a abrir el enlace recupera sus trabajos; otra sesión no los ve
+    if "sesion" not in st.query_params:
+        st.query_params["sesion"] = uuid.uuid4().hex
+    return st.query_params["sesion"]
+
+def describir_trabajo(trabajo) -> str:
+    # Sin el estado: si la etiqueta cambiase, Streamlit reiniciaría la selección
+    hora = datetime.fromtimestamp(trabajo.creado).strftime("%d/%m %H:%M:%S")
+    return f"{hora} · {trabajo.total} archivos · {trabajo.id[:8]}"
+
+@st.fragment(run_every=INTERVALO_SONDEO)
+def mostrar_progreso(sesion, id_trabajo):
+    # Se vuelve a ejecutar cada INTERVALO_SONDEO s sin bloquear el resto de la
+    # página; cuando el trabajo termina, se recarga la página con los resultados
+    trabajo = cola.trabajo(sesion, id_trabajo)
+    if trabajo is None:
+        return
+    if trabajo.estado == TERMINADO:
+        st.rerun()
+    st.progress(trabajo.procesadas / trabajo.total,
+                text=f"Procesando facturas ({trabajo.estado}): {trabajo.procesadas}/{trabajo.total}")
+    filas = trabajo.filas()
+    if filas:
+        st.dataframe(pd.DataFrame(filas))
+
+def mostrar_resultado(trabajo):
+    resultado = trabajo.resultado
+    if resultado is not None and resultado.df is not None:
+        df_resultados = resultado.df
+        clave = resultado.clave
+        st.success(f"¡{len(df_resultados)} facturas procesadas correctamente!")
+        for resumen in resultado.resumenes:
+            st.caption(resumen)
+        st.dataframe(df_resultados)
+        # Descargas: los bytes se generan solo al pulsar y se reutilizan en adelante
+        columnas = st.columns(len(FORMATOS_EXPORTACION))
+        for columna, (formato, (etiqueta, mime, _)) in zip(columnas, FORMATOS_EXPORTACION.items()):
+            columna.download_button(
+                label=etiqueta,
+                data=lambda formato=formato: exportar_resultados(df_resultados, clave, formato),
+                file_name=f"facturas_extraidas.{formato}",
+                mime=mime,
+                on_click="ignore",
+            )
+    if trabajo.errores:
+        st.error("Se produjeron errores en algunos archivos:")
+        for e in trabajo.errores:
+            st.write(e)
+    if resultado is not None:
+        with st.expander("📊 Métricas del trabajo"):
+            etapas = resultado.metricas["etapas"]
+            st.dataframe(pd.DataFrame(
+                [{"Etapa": n, **{k: v for k, v in e.items() if k != "histograma"}} for n, e in etapas.items()]
+            ))
+            st.json(resultado.metricas)
+
 # --- Streamlit App State ---
 if "uploaded_files" not in st.session_state:
-    st.session_state.uploaded_files = []
-if "resultados" not in st.session_state:
-    st.session_state.resultados = None
-if "errores" not in st.session_state:
-    st.session_state.errores = None
-if "procesado" not in st.session_state:
-    st.session_state.procesado = False
-
-split_dir = "split_temp"
-os.makedirs(split_dir, exist_ok=True)
+    st.session_state.uploaded_files = {}   # nombre -> bytes del PDF (en memoria, hasta enviarlos)
 
 st.set_page_config(page_title="Lector de Facturas", layout="wide")
 st.title("📄 Lector de Facturas con Document AI")
+sesion = sesion_actual()
 
 # Subida de archivos (en varias tandas)
 uploaded_files = st.file_uploader(
@@ -107,79 +231,35 @@ uploaded_files = st.file_uploader(
     key="fileuploader"
 )
 
-# Guardar archivos subidos temporalmente
+# Guardar en memoria los archivos subidos (sin pasar por disco)
 if uploaded_files:
     for uploaded in uploaded_files:
-        temp_path = os.path.join(split_dir, uploaded.name)
         # Evita duplicados
-        if not os.path.exists(temp_path):
-            with open(temp_path, "wb") as f:
-                f.write(uploaded.read())
-    # Actualiza la lista interna de archivos
-    st.session_state.uploaded_files = [
-        os.path.join(split_dir, f) for f in os.listdir(split_dir) if f.endswith('.pdf')
-    ]
+        if uploaded.name not in st.session_state.uploaded_files:
+            st.session_state.uploaded_files[uploaded.name] = uploaded.getvalue()
     st.info(f"{len(st.session_state.uploaded_files)} archivos preparados para procesar.")
 
-# Botón para procesar solo cuando lo pulse el usuario
-if st.button("Procesar"):
-    resultados = []
-    errores = []
-    total = len(st.session_state.uploaded_files)
-    progreso = st.progress(0)
-    procesadas = 0
-    with st.spinner("Procesando facturas..."):
-        for temp_path in st.session_state.uploaded_files:
-            with open(temp_path, "rb") as f:
-                pdf_bytes = f.read()
-            datos, error = procesar_factura_bytes(pdf_bytes, os.path.basename(temp_path))
-            if datos:
-                resultados.append(datos)
-            else:
-                errores.append(error)
-            procesadas += 1
-            progreso.progress(procesadas / total if total else 1)
-    progreso.progress(1.0)
-    # Muestra resultados
-    if resultados:
-        df = pd.DataFrame(resultados)
-        st.success(f"¡{len(resultados)} facturas procesadas correctamente!")
-        st.session_state.resultados = df
-    else:
-        st.session_state.resultados = None
-    st.session_state.errores = errores
-    st.session_state.procesado = True
-
-    # Limpieza automática de archivos temporales tras procesar
-    shutil.rmtree(split_dir)
-    os.makedirs(split_dir, exist_ok=True)
-    st.session_state.uploaded_files = []
+# "Procesar" solo encola el trabajo: la página sigue respondiendo mientras se procesa
+if st.button("Procesar", disabled=not st.session_state.uploaded_files):
+    st.session_state.trabajo = cola.enviar(sesion, st.session_state.uploaded_files.items())
+    st.session_state.uploaded_files = {}
 
-# Botón para limpiar resultados
+# Botón para limpiar resultados (los trabajos en curso continúan)
 if st.button("Limpiar resultados"):
-    st.session_state.resultados = None
-    st.session_state.errores = None
-    st.session_state.procesado = False
-    st.session_state.uploaded_files = []
-    if os.path.exists(split_dir):
-        shutil.rmtree(split_dir)
-        os.makedirs(split_dir, exist_ok=True)
+    cola.olvidar(sesion)
+    st.session_state.uploaded_files = {}
+    st.session_state.pop("trabajo", None)
     st.info("Los resultados han sido limpiados. Puedes subir nuevos PDFs.")
 
-# Mostrar resultados si hay
-if st.session_state.procesado and st.session_state.resultados is not None:
-    st.dataframe(st.session_state.resultados)
-    # Descargar Excel
-    towrite = io.BytesIO()
-    st.session_state.resultados.to_excel(towrite, index=False, engine="openpyxl")
-    towrite.seek(0)
-    st.download_button(
-        label="⬇️ Descargar Excel",
-        data=towrite,
-        file_name="facturas_extraidas.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-    )
-if st.session_state.procesado and st.session_state.errores:
-    st.error("Se produjeron errores en algunos archivos:")
-    for e in st.session_state.errores:
-        st.write(e)
+# Trabajos de esta sesión: el más reciente, salvo que se elija otro
+trabajos = {t.id: t for t in cola.trabajos(sesion)}
+if trabajos:
+    if st.session_state.get("trabajo") not in trabajos:
+        st.session_state.trabajo = next(iter(trabajos))
+    st.selectbox("Trabajo", list(trabajos), key="trabajo",
+                 format_func=lambda id_trabajo: describir_trabajo(trabajos[id_trabajo]))
+    trabajo = trabajos[st.session_state.trabajo]
+    if trabajo.estado == TERMINADO:
+        mostrar_resultado(trabajo)
+    else:
+        mostrar_progreso(sesion, trabajo.id)
@@ -0,0 +1,165 @@
+import glob
+import hashlib
+import json
+import mmap
+import os
+import threading
+import time
+import zlib
+
+# --- ARCHIVO DE DOCUMENTS ---
+# Guarda el Document de cada PDF tal como lo devolvió Document AI (o la ruta
+# local), para poder volver a aplicar el mapeo de entidades a facturas
+# antiguas sin pagar otra vez el OCR (modo --reextract).
+#
+# <segmento>.bin: registros concatenados (Document serializado y comprimido)
+# <segmento>.idx: una línea JSON por blob con su md5/generation y, por cada
+#                 factura del PDF, [rango_de_páginas, offset, longitud]
+# Ambos son append-only y cada proceso escribe en su propio segmento (modo
+# --all); al leer se juntan todos los índices y, si un blob se procesó más
+# de una vez, vale la entrada más reciente. Un blob cuyo md5/generation y
+# Documents (huella) ya están en el segmento no se vuelve a escribir.
+
+DIR_ARCHIVO      = os.path.join("output_docai", "documentos")
+SEGMENTO_ARCHIVO = "documentos"
+
+
+class ArchivoDocumentos:
+    """Archivo binario de Documents con índice de offsets, leído con mmap."""
+
+    def __init__(self, directorio: str = DIR_ARCHIVO, segmento: str = SEGMENTO_ARCHIVO):
+        os.makedirs(directorio, exist_ok=True)
+        self.directorio = directorio
+        self.segmento = segmento
+        self._indice = None     # Todos los segmentos: se lee al enlazar o al leer
+        self._propias = None    # {blob: (generation, md5, huella)} de este segmento, para guardar()
+        self._datos = None
+        self._f_indice = None
+        self._mapas = {}
+        self._lock = threading.RLock()
+
+    def _ruta(self, segmento: str, extension: str) -> str:
+        return os.path.join(self.directorio, segmento + extension)
+
+    @property
+    def indice(self) -> dict:
+        """{blob: entrada} de todos los segmentos, leído la primera vez que hace falta."""
+        with self._lock:
+            if self._indice is None:
+                self._indice = self._leer_indice(glob.glob(os.path.join(self.directorio, "*.idx")))
+            return self._indice
+
+    @staticmethod
+    def _leer_indice(rutas) -> dict:
+        indice = {}
+        for ruta in rutas:
+            if not os.path.exists(ruta):
+                continue
+            segmento = os.path.splitext(os.path.basename(ruta))[0]
+            with open(ruta, encoding="utf-8") as f:
+                for linea in f:
+                    try:
+                        entrada = json.loads(linea)
+                    except json.JSONDecodeError:
+                        continue   # Línea a medio escribir cuando se cortó la ejecución
+                    entrada.setdefault("segmento", segmento)
+                    previa = indice.get(entrada["blob"])
+                    if previa is None or entrada.get("creado", 0) >= previa.get("creado", 0):
+                        indice[entrada["blob"]] = entrada
+        return indice
+
+    def _abrir_escritura(self) -> None:
+        if self._datos is None:
+            self._datos = open(self._ruta(self.segmento, ".bin"), "ab")
+            self._f_indice = open(self._ruta(self.segmento, ".idx"), "a", encoding="utf-8")
+
+    @staticmethod
+    def _clave(entrada: dict) -> tuple:
+        return entrada.get("generation"), entrada.get("md5_hash"), entrada.get("huella")
+
+    def _archivado(self, blob, huella: str) -> bool:
+        """¿Tiene ya este segmento el blob con el mismo md5/generation y Documents? Con el lock."""
+        if self._propias is None:
+            # Solo el .idx propio: en --all cada fragmento vuelve a escribir en su segmento
+            entradas = self._leer_indice([self._ruta(self.segmento, ".idx")])
+            self._propias = {nombre: self._clave(e) for nombre, e in entradas.items()}
+        return self._propias.get(blob.name) == (blob.generation, blob.md5_hash, huella)
+
+    def _anadir_entrada(self, entrada: dict) -> None:
+        # El índice se escribe después de los datos: una entrada siempre apunta a bytes completos
+        self._f_indice.write(json.dumps(entrada, ensure_ascii=False) + "\n")
+        self._f_indice.flush()
+        if self._propias is not None:
+            self._propias[entrada["blob"]] = self._clave(entrada)
+        if self._indice is not None:
+            self._indice[entrada["blob"]] = entrada
+
+    def guardar(self, blob, documentos: list[tuple[str, object]]) -> None:
+        """
+        Archiva los [(rango_de_páginas, Document)] de un blob; seguro entre hilos.
+        Si ya estaban archivados igual (aciertos de caché, --forzar), no escribe nada.
+        """
+        from google.cloud import documentai_v1 as documentai
+        serializados = [(rango, documentai.Document.serialize(doc)) for rango, doc in documentos]
+        h = hashlib.blake2b(digest_size=16)
+        for rango, datos in serializados:
+            h.update(rango.encode("utf-8") + b"\0" + datos)
+        huella = h.hexdigest()
+        with self._lock:
+            if self._archivado(blob, huella):
+                return
+        registros = [(rango, zlib.compress(datos)) for rango, datos in serializados]
+        with self._lock:
+            self._abrir_escritura()
+            facturas = []
+            for rango, datos in registros:
+                facturas.append([rango, self._datos.tell(), len(datos)])
+                self._datos.write(datos)
+            self._datos.flush()
+            self._anadir_entrada({
+                "blob": blob.name,
+                "generation": blob.generation,
+                "md5_hash": blob.md5_hash,
+                "segmento": self.segmento,
+                "creado": time.time(),
+                "huella": huella,
+                "facturas": facturas,
+            })
+
+    def enlazar(self, blob, original) -> None:
+        """Registra 'blob' (copia idéntica de 'original') con los mismos Documents."""
+        with self._lock:
+            entrada = self.indice.get(original.name)
+            if entrada is None or self._archivado(blob, entrada.get("huella")):
+                return
+            self._abrir_escritura()
+            self._anadir_entrada({**entrada, "blob": blob.name, "generation": blob.generation,
+                                  "md5_hash": blob.md5_hash, "creado": time.time()})
+
+    def blobs(self) -> list[str]:
+        return list(self.indice)
+
+    def documentos(self, nombre_blob: str) -> list[tuple[str, object]]:
+        """[(rango_de_páginas, Document)] archivados de un blob, sin tocar la red."""
+        from google.cloud import documentai_v1 as documentai
+        entrada = self.indice[nombre_blob]
+        mapa = self._mapas.get(entrada["segmento"])
+        if mapa is None:
+            with open(self._ruta(entrada["segmento"], ".bin"), "rb") as f:
+                mapa = self._mapas[entrada["segmento"]] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return [
+            (rango, documentai.Document.deserialize(zlib.decompress(mapa[offset:offset + longitud])))
+            for rango, offset, longitud in entrada["facturas"]
+        ]
+
+    def cerrar(self) -> None:
+        with self._lock:
+            if self._datos is not None:
+                for f in (self._datos, self._f_indice):
+                    f.flush()
+                    os.fsync(f.fileno())
+                    f.close()
+                self._datos = self._f_indice = None
+            for mapa in self._mapas.values():
+                mapa.close()
+            self._mapas = {}
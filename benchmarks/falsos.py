@@ -0,0 +1,279 @@
+"""
+Sustitutos locales de Document AI y Google Cloud Storage para medir el
+rendimiento sin proyecto real ni facturación.
+
+La latencia, su variación y la tasa de errores son configurables, y el
+cliente devuelve un Document sintético con las mismas entidades que el
+Invoice Processor. Con un FalsoStorageClient como 'almacen', el cliente
+síncrono también admite batch_process_documents: lee los PDFs de sus
+buckets y escribe cada Document en fragmentos JSON, como el modo --batch.
+"""
+import asyncio
+import hashlib
+import random
+import threading
+import time
+
+from google.api_core import exceptions as gexc
+from google.cloud import documentai_v1 as documentai
+
+
+def documento_sintetico(n: int):
+    """Document con las entidades que leen los tres scripts."""
+    entidad = documentai.Document.Entity
+    base = 100 + n % 900
+    iva = round(base * 0.21, 2)
+    importe = lambda v: f"{v:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+    texto = (f"PROVEEDOR {n} S.L.\nCIF B{n % 10_000_000:07d}0\nFactura nº F-{n}\n"
+             f"Fecha 01/01/2024\nCONCEPTO Servicios {n}\nBASE IMPONIBLE {importe(base)}\n"
+             f"IVA 21% {importe(iva)}\nTOTAL {importe(base + iva)}\n")
+    return documentai.Document(text=texto, entities=[
+        entidad(type_="supplier_name", mention_text=f"Proveedor {n} S.L."),
+        entidad(type_="supplier_tax_id", mention_text=f"B{n % 10_000_000:07d}0"),
+        entidad(type_="supplier_address", mention_text="Calle Mayor 1, Madrid"),
+        entidad(type_="invoice_id", mention_text=f"F-{n}"),
+        entidad(type_="invoice_date", mention_text="01/01/2024"),
+        entidad(type_="net_amount", mention_text=importe(base)),
+        entidad(type_="total_tax_amount", mention_text=importe(iva)),
+        entidad(type_="total_amount", mention_text=importe(base + iva)),
+        entidad(type_="vat", properties=[
+            entidad(type_="vat/amount", mention_text=importe(base)),
+            entidad(type_="vat/tax_amount", mention_text=importe(iva)),
+        ]),
+        entidad(type_="line_item", properties=[
+            entidad(type_="line_item/description", mention_text=f"Servicios {n}"),
+        ]),
+    ])
+
+
+class Registro:
+    """Marca de inicio (descarga) y fin (respuesta de OCR) de cada factura."""
+
+    def __init__(self):
+        self.inicio = {}
+        self.fin = {}
+        self._lock = threading.Lock()
+
+    def marcar_inicio(self, clave):
+        with self._lock:
+            self.inicio.setdefault(clave, time.perf_counter())
+
+    def marcar_fin(self, clave):
+        with self._lock:
+            self.fin[clave] = time.perf_counter()
+
+    def latencias(self) -> list[float]:
+        with self._lock:
+            return [self.fin[c] - self.inicio[c] for c in self.fin if c in self.inicio]
+
+
+class _Comportamiento:
+    def __init__(self, latencia: float, variacion: float, tasa_error: float, semilla: int):
+        self.latencia = latencia
+        self.variacion = variacion
+        self.tasa_error = tasa_error
+        self._random = random.Random(semilla)
+        self._lock = threading.Lock()
+        self.llamadas = 0
+
+    def siguiente(self) -> tuple[int, float, bool]:
+        with self._lock:
+            self.llamadas += 1
+            espera = max(0.0, self._random.gauss(self.latencia, self.variacion))
+            return self.llamadas, espera, self._random.random() < self.tasa_error
+
+
+def _numero_factura(content: bytes) -> int:
+    # El contenido de los PDFs falsos es "%PDF-falso-<n>-<ejecución>"
+    try:
+        return int(content.split(b"-")[2])
+    except (IndexError, ValueError):
+        return 0
+
+
+def _dividir_uri(gcs_uri: str) -> tuple[str, str]:
+    bucket_name, _, ruta = gcs_uri[len("gs://"):].partition("/")
+    return bucket_name, ruta
+
+
+class FalsaOperacion:
+    """Operación de larga duración de batch_process_documents, ya terminada."""
+
+    def __init__(self, metadata):
+        self.metadata = metadata
+
+    def done(self) -> bool:
+        return True
+
+    def result(self, timeout=None):
+        return None
+
+
+class FalsoDocAIClient:
+    """Sustituto síncrono de DocumentProcessorServiceClient."""
+
+    def __init__(self, latencia=0.05, variacion=0.01, tasa_error=0.0, semilla=0, registro=None,
+                 almacen=None):
+        self.comportamiento = _Comportamiento(latencia, variacion, tasa_error, semilla)
+        self.registro = registro or Registro()
+        self.almacen = almacen     # FalsoStorageClient de batch_process_documents
+        self._operaciones = 0
+
+    def process_document(self, request=None, **kwargs):
+        _, espera, falla = self.comportamiento.siguiente()
+        time.sleep(espera)
+        if falla:
+            raise gexc.ServiceUnavailable("Fallo simulado")
+        content = request.raw_document.content
+        self.registro.marcar_fin(content)
+        return documentai.ProcessResponse(document=documento_sintetico(_numero_factura(content)))
+
+    def batch_process_documents(self, request=None, **kwargs):
+        """
+        Procesa en el acto los PDFs de la petición: cada Document queda en
+        <salida>/<operación>/<i>/ en dos fragmentos JSON, escritos en orden
+        inverso. Con 'tasa_error', algunos PDFs terminan con estado de error.
+        """
+        if self.almacen is None:
+            raise ValueError("FalsoDocAIClient necesita 'almacen' para batch_process_documents")
+        estado = documentai.BatchProcessMetadata.IndividualProcessStatus
+        salida = request.document_output_config.gcs_output_config.gcs_uri.rstrip("/")
+        self._operaciones += 1
+        estados = []
+        for i, documento in enumerate(request.input_documents.gcs_documents.documents):
+            _, _, falla = self.comportamiento.siguiente()
+            if falla:
+                estados.append(estado(input_gcs_source=documento.gcs_uri,
+                                      status={"code": 13, "message": "Fallo simulado"}))
+                continue
+            blob = self.almacen.bucket(_dividir_uri(documento.gcs_uri)[0]).get_blob(
+                _dividir_uri(documento.gcs_uri)[1]
+            )
+            content = blob.download_as_bytes()
+            destino = f"{salida}/{self._operaciones}/{i}"
+            self._escribir_fragmentos(destino, documento_sintetico(_numero_factura(content)))
+            self.registro.marcar_fin(content)
+            estados.append(estado(input_gcs_source=documento.gcs_uri, status={"code": 0},
+                                  output_gcs_destination=destino))
+        return FalsaOperacion(documentai.BatchProcessMetadata(individual_process_statuses=estados))
+
+    def _escribir_fragmentos(self, destino: str, doc) -> None:
+        bucket_name, prefijo = _dividir_uri(destino)
+        corte = len(doc.text) // 2
+        fragmentos = [
+            documentai.Document(text=doc.text[:corte], entities=doc.entities,
+                                shard_info={"shard_index": 0, "shard_count": 2}),
+            documentai.Document(text=doc.text[corte:],
+                                shard_info={"shard_index": 1, "shard_count": 2, "text_offset": corte}),
+        ]
+        bucket = self.almacen.bucket(bucket_name)
+        for k in reversed(range(len(fragmentos))):
+            bucket.blob(f"{prefijo}/factura-{k}.json").upload_from_string(
+                documentai.Document.to_json(fragmentos[k])
+            )
+
+
+class FalsoDocAIAsyncClient:
+    """Sustituto de DocumentProcessorServiceAsyncClient (misma latencia, con asyncio.sleep)."""
+
+    def __init__(self, latencia=0.05, variacion=0.01, tasa_error=0.0, semilla=0, registro=None):
+        self.comportamiento = _Comportamiento(latencia, variacion, tasa_error, semilla)
+        self.registro = registro or Registro()
+
+    async def process_document(self, request=None, **kwargs):
+        _, espera, falla = self.comportamiento.siguiente()
+        await asyncio.sleep(espera)
+        if falla:
+            raise gexc.ServiceUnavailable("Fallo simulado")
+        content = request.raw_document.content
+        self.registro.marcar_fin(content)
+        return documentai.ProcessResponse(document=documento_sintetico(_numero_factura(content)))
+
+
+class FalsoBlob:
+    def __init__(self, name: str, content: bytes, registro: Registro, latencia_descarga: float = 0.0,
+                 bucket=None):
+        self.name = name
+        self.bucket = bucket
+        self.generation = 0
+        self._registro = registro
+        self._latencia = latencia_descarga
+        self._asignar(content)
+
+    def _asignar(self, content: bytes) -> None:
+        self.size = len(content)
+        self.generation += 1
+        self.md5_hash = hashlib.md5(content).hexdigest()
+        self._content = content
+
+    def download_as_bytes(self) -> bytes:
+        self._registro.marcar_inicio(self._content)
+        if self._latencia:
+            time.sleep(self._latencia)
+        return self._content
+
+    def upload_from_string(self, data) -> None:
+        self._asignar(data.encode() if isinstance(data, str) else data)
+        self.bucket._blobs[self.name] = self
+
+    def delete(self) -> None:
+        del self.bucket._blobs[self.name]
+
+
+class _Listado(list):
+    """Lista de blobs con el atributo 'prefixes' del iterador de GCS."""
+    prefixes = frozenset()
+
+
+class FalsoBucket:
+    """
+    Bucket con 'n' facturas repartidas en clientes/proyectos:
+    Cliente<i>/Proyecto<j>/factura_<n>.pdf
+    """
+
+    def __init__(self, n: int, registro: Registro, clientes: int = 5, proyectos: int = 4,
+                 latencia_descarga: float = 0.0, ejecucion: str = "0", name: str = "bucket-falso"):
+        self.name = name
+        self._registro = registro
+        self._blobs = {}
+        for k in range(n):
+            ruta = f"Cliente{k % clientes}/Proyecto{(k // clientes) % proyectos}/factura_{k}.pdf"
+            content = f"%PDF-falso-{k}-{ejecucion}".encode()
+            self._blobs[ruta] = FalsoBlob(ruta, content, registro, latencia_descarga, bucket=self)
+
+    @property
+    def blobs(self) -> list:
+        return list(self._blobs.values())
+
+    def blob(self, nombre: str) -> FalsoBlob:
+        """Blob todavía sin subir (ver FalsoBlob.upload_from_string)."""
+        return FalsoBlob(nombre, b"", self._registro, bucket=self)
+
+    def get_blob(self, nombre: str):
+        return self._blobs.get(nombre)
+
+    def list_blobs(self, prefix=None, delimiter=None, **kwargs):
+        prefix = prefix or ""
+        blobs = [b for b in self.blobs if b.name.startswith(prefix)]
+        if not delimiter:
+            return _Listado(blobs)
+        listado = _Listado(b for b in blobs if delimiter not in b.name[len(prefix):])
+        listado.prefixes = {
+            prefix + b.name[len(prefix):].split(delimiter, 1)[0] + delimiter
+            for b in blobs if delimiter in b.name[len(prefix):]
+        }
+        return listado
+
+
+class FalsoStorageClient:
+    """Buckets por nombre; uno que no existe (p. ej. el de --salida-lote) se crea vacío."""
+
+    def __init__(self, bucket: FalsoBucket = None):
+        self._buckets = {bucket.name: bucket} if bucket is not None else {}
+        self._lock = threading.Lock()
+
+    def bucket(self, nombre):
+        with self._lock:
+            if nombre not in self._buckets:
+                self._buckets[nombre] = FalsoBucket(0, Registro(), name=nombre)
+            return self._buckets[nombre]
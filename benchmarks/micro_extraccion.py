@@ -0,0 +1,72 @@
+"""
+Microbenchmark de extraccion.extraer_campos.
+
+Mide los microsegundos por Document de las dos rutas de la extracción:
+con base e IVA en las entidades (lo habitual) y sin ellos, cuando se
+buscan en el texto del OCR (facturas de varias páginas con texto largo).
+
+    python benchmarks/micro_extraccion.py
+    python benchmarks/micro_extraccion.py --documentos 20000 --lineas 400
+"""
+import argparse
+import os
+import sys
+import time
+
+from google.cloud import documentai_v1 as documentai
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extraccion import extraer_campos  # noqa: E402
+from falsos import documento_sintetico  # noqa: E402
+
+REPETICIONES = 5
+
+
+def documento_solo_texto(n: int, lineas: int):
+    """Document sin importes en las entidades: base, IVA y concepto salen del texto."""
+    relleno = "".join(f"Línea {i} del detalle de la factura {n}, unidades 3 x 12,50\n"
+                      for i in range(lineas))
+    texto = (f"PROVEEDOR {n} S.L.\nFactura nº F-{n}\nCONCEPTO Servicios {n}\n{relleno}"
+             f"BASE IMPONIBLE 1.234,56\nIVA (21%): 259,26\nTOTAL 1.493,82\n")
+    entidad = documentai.Document.Entity
+    return documentai.Document(text=texto, entities=[
+        entidad(type_="supplier_name", mention_text=f"Proveedor {n} S.L."),
+        entidad(type_="invoice_id", mention_text=f"F-{n}"),
+    ])
+
+
+def medir(documentos) -> float:
+    """Mejor tiempo, en µs por documento, de extraer los campos de todos."""
+    tiempos = []
+    for _ in range(REPETICIONES):
+        inicio = time.perf_counter()
+        for doc in documentos:
+            extraer_campos(doc)
+        tiempos.append(time.perf_counter() - inicio)
+    return min(tiempos) / len(documentos) * 1e6
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Microbenchmark de la extracción de campos")
+    parser.add_argument("--documentos", type=int, default=5000,
+                        help="Nº de documentos por ruta (por defecto 5000)")
+    parser.add_argument("--lineas", type=int, default=200,
+                        help="Líneas de detalle del texto en la ruta de texto (por defecto 200)")
+    return parser.parse_args()
+
+
+def main():
+    opciones = parse_args()
+    rutas = {
+        "entidades": [documento_sintetico(i) for i in range(opciones.documentos)],
+        "texto": [documento_solo_texto(i, opciones.lineas) for i in range(opciones.documentos)],
+    }
+    print(f"{'ruta':>10} {'µs/doc':>9} {'docs/s':>10}")
+    for ruta, documentos in rutas.items():
+        us = medir(documentos)
+        print(f"{ruta:>10} {us:>9.1f} {1e6 / us:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
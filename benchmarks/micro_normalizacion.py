@@ -0,0 +1,70 @@
+"""
+Microbenchmark de normalizacion.normalizar_resultados.
+
+Genera un DataFrame de resultados con importes en formato español, fechas
+dd/mm/aaaa y CIF sin normalizar, y mide cuánto tarda en convertirse a
+columnas tipadas (mejor de varias repeticiones).
+
+    python benchmarks/micro_normalizacion.py
+    python benchmarks/micro_normalizacion.py --filas 10000 100000 1000000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from normalizacion import normalizar_resultados  # noqa: E402
+
+REPETICIONES = 5
+
+
+def importe_es(valores):
+    # 1234.5 -> "1.234,50"
+    return [f"{v:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".") for v in valores]
+
+
+def resultados_sinteticos(n: int, semilla: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(semilla)
+    base = rng.uniform(1, 50_000, n).round(2)
+    iva = (base * 0.21).round(2)
+    dias = rng.integers(1, 29, n)
+    meses = rng.integers(1, 13, n)
+    return pd.DataFrame({
+        "Archivo": [f"Cliente/Proyecto/factura_{i}.pdf" for i in range(n)],
+        "CIF_Proveedor": [f"b-{i % 5000:08d}" for i in range(n)],
+        "CIF_Cliente": [f"ES A{i % 200:08d}" for i in range(n)],
+        "Fecha": [f"{d:02d}/{m:02d}/2024" for d, m in zip(dias, meses)],
+        "Base Imponible": importe_es(base),
+        "IVA": importe_es(iva),
+        "Total": importe_es(base + iva),
+    })
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Microbenchmark de la normalización de resultados")
+    parser.add_argument("--filas", type=int, nargs="+", default=[10_000, 100_000],
+                        help="Nº de filas del DataFrame (por defecto 10000 100000)")
+    return parser.parse_args()
+
+
+def main():
+    opciones = parse_args()
+    print(f"{'filas':>9} {'segundos':>9} {'filas/s':>12} {'cuadran':>8}")
+    for n in opciones.filas:
+        df = resultados_sinteticos(n)
+        tiempos = []
+        for _ in range(REPETICIONES):
+            inicio = time.perf_counter()
+            normalizado = normalizar_resultados(df)
+            tiempos.append(time.perf_counter() - inicio)
+        mejor = min(tiempos)
+        print(f"{n:>9} {mejor:>9.3f} {n / mejor:>12.0f} {normalizado['Cuadra'].mean():>8.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+Banco de pruebas de rendimiento sin conexión.
+
+Ejecuta los puntos de entrada reales (process_with_docai.main,
+facturas_app.main_interactivo y app_lectorfacturas.procesar_factura_bytes)
+contra los sustitutos de benchmarks/falsos.py y mide, para cada modo y
+tamaño, facturas/segundo, latencia p50/p95 por factura y pico de memoria
+(tracemalloc). También mide el arranque de cada CLI ('--help' en un proceso
+nuevo y tiempo de importación del módulo con -X importtime).
+
+    python benchmarks/rendimiento.py
+    python benchmarks/rendimiento.py --tamanos 100 1000 --latencia 0.02 --json resultados.json
+"""
+import argparse
+import builtins
+import contextlib
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import falsos  # noqa: E402
+
+TAMANOS_POR_DEFECTO = [100, 1000, 10000]
+WORKERS_BENCH = 16
+REPETICIONES_ARRANQUE = 5
+SCRIPTS_ARRANQUE = ["process_with_docai", "facturas_app"]
+
+
+# --- Instalación de los sustitutos ---
+
+def instalar_falsos(opciones):
+    """
+    Sustituye las clases de los clientes de Google antes de importar los
+    scripts, que los crean al primer uso. Devuelve el Registro compartido.
+    """
+    from google.cloud import documentai_v1, storage
+    from google.oauth2 import service_account
+    import streamlit
+
+    registro = falsos.Registro()
+    parametros = dict(latencia=opciones.latencia, variacion=opciones.variacion,
+                      tasa_error=opciones.tasa_error, registro=registro)
+    documentai_v1.DocumentProcessorServiceClient = lambda *a, **k: falsos.FalsoDocAIClient(**parametros)
+    documentai_v1.DocumentProcessorServiceAsyncClient = (
+        lambda *a, **k: falsos.FalsoDocAIAsyncClient(**parametros)
+    )
+    storage.Client = lambda *a, **k: falsos.FalsoStorageClient()
+
+    # app_lectorfacturas lee las credenciales de st.secrets al importarse
+    streamlit.secrets = {"google": {"credentials": "{}"}}
+    service_account.Credentials.from_service_account_info = staticmethod(
+        lambda info: type("CredencialesFalsas", (), {"refresh": lambda self, r: None})()
+    )
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    return registro, parametros
+
+
+@contextlib.contextmanager
+def directorio_temporal():
+    """Cada ejecución escribe output_docai/ y .cache_docai/ en un directorio limpio."""
+    anterior = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            yield tmp
+        finally:
+            os.chdir(anterior)
+
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))]
+
+
+def medir(ejecutar, n):
+    """Ejecuta 'ejecutar()' silenciando la salida; devuelve (segundos, pico_bytes, error)."""
+    error = None
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    with open(os.devnull, "w") as nulo, contextlib.redirect_stdout(nulo):
+        try:
+            ejecutar()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    segundos = time.perf_counter() - inicio
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return segundos, pico, error
+
+
+# --- Escenarios ---
+
+def escenario_cli(modulo, funcion, argumentos, registro, parametros, opciones, carpetas=(5, 4)):
+    def ejecutar(n):
+        bucket = falsos.FalsoBucket(n, registro, clientes=carpetas[0], proyectos=carpetas[1],
+                                    latencia_descarga=opciones.latencia_descarga,
+                                    ejecucion=uuid.uuid4().hex[:8], name=modulo.BUCKET_NAME)
+        # --batch lee los PDFs y escribe los JSON en los buckets de 'almacen'
+        almacen = falsos.FalsoStorageClient(bucket)
+        with directorio_temporal():
+            modulo.bucket = bucket
+            modulo.storage_client = almacen
+            modulo.docai_client = falsos.FalsoDocAIClient(**parametros, almacen=almacen)
+            sys.argv = [modulo.__name__] + argumentos
+            segundos, pico, error = medir(getattr(modulo, funcion), n)
+        claves = {b._content for b in bucket.blobs}
+        latencias = [registro.fin[c] - registro.inicio[c]
+                     for c in claves if c in registro.fin and c in registro.inicio]
+        return segundos, pico, error, latencias
+    return ejecutar
+
+
+def escenario_app(app, workers, sesiones=1):
+    """Secuencial (workers=1) o enviando los PDFs como 'sesiones' trabajos a la cola de la app."""
+    from cache_docai import CacheDocAI
+    from cola_trabajos import ColaTrabajos
+
+    def ejecutar(n):
+        ejecucion = uuid.uuid4().hex[:8]
+        pdfs = [(f"factura_{k}.pdf", f"%PDF-falso-{k}-{ejecucion}".encode()) for k in range(n)]
+        latencias = []
+
+        def una(pdf_bytes, nombre, contexto):
+            inicio = time.perf_counter()
+            resultado = app.procesar_factura_bytes(pdf_bytes, nombre, contexto)
+            latencias.append(time.perf_counter() - inicio)
+            return resultado
+
+        with directorio_temporal():
+            app.cache = CacheDocAI()
+            if workers <= 1:
+                contexto = app.nueva_ejecucion()
+                segundos, pico, error = medir(lambda: [una(p[1], p[0], contexto) for p in pdfs], n)
+            else:
+                def en_cola():
+                    cola = ColaTrabajos(una, workers, crear_contexto=app.nueva_ejecucion)
+                    trabajos = [cola.enviar(f"sesion-{s}", pdfs[s::sesiones]) for s in range(sesiones)]
+                    for s, id_trabajo in enumerate(trabajos):
+                        cola.trabajo(f"sesion-{s}", id_trabajo).esperar()
+                    cola.cerrar()
+                segundos, pico, error = medir(en_cola, n)
+            app.cache.cerrar()
+        return segundos, pico, error, latencias
+    return ejecutar
+
+
+def escenarios(registro, parametros, opciones):
+    import process_with_docai
+    import facturas_app
+    import app_lectorfacturas
+
+    # facturas_app es interactivo: se elige siempre la primera opción del menú
+    builtins.input = lambda *a, **k: "1"
+    comunes = ["--sin-cache", "--sin-texto-local"]
+    cli = lambda m, f, args: escenario_cli(m, f, args + comunes, registro, parametros, opciones)
+    # Un solo cliente/proyecto para que la sesión interactiva procese las n facturas
+    interactivo = lambda args: escenario_cli(facturas_app, "main_interactivo", args + comunes,
+                                             registro, parametros, opciones, carpetas=(1, 1))
+    return [
+        ("process_with_docai.main", "secuencial", cli(process_with_docai, "main", ["--forzar"])),
+        ("process_with_docai.main", f"--workers {WORKERS_BENCH}",
+         cli(process_with_docai, "main", ["--forzar", "--workers", str(WORKERS_BENCH)])),
+        ("process_with_docai.main", "--async", cli(process_with_docai, "main", ["--forzar", "--async"])),
+        ("process_with_docai.main", "--batch", cli(process_with_docai, "main", ["--forzar", "--batch"])),
+        ("facturas_app.main_interactivo", "secuencial", interactivo([])),
+        ("facturas_app.main_interactivo", f"--workers {WORKERS_BENCH}",
+         interactivo(["--workers", str(WORKERS_BENCH)])),
+        ("facturas_app.main_interactivo", "--async", interactivo(["--async"])),
+        ("app.procesar_factura_bytes", "secuencial", escenario_app(app_lectorfacturas, 1)),
+        ("app.procesar_factura_bytes", f"cola {app_lectorfacturas.MAX_WORKERS}",
+         escenario_app(app_lectorfacturas, app_lectorfacturas.MAX_WORKERS)),
+        ("app.procesar_factura_bytes", f"cola {app_lectorfacturas.MAX_WORKERS}, 4 sesiones",
+         escenario_app(app_lectorfacturas, app_lectorfacturas.MAX_WORKERS, sesiones=4)),
+    ]
+
+
+# --- Arranque de los CLI ---
+
+def importacion_ms(modulo):
+    """Tiempo acumulado de 'import modulo' según -X importtime, en ms."""
+    salida = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {modulo}"],
+                            cwd=RAIZ, capture_output=True, text=True, check=True).stderr
+    for linea in reversed(salida.splitlines()):
+        campos = [c.strip() for c in linea.split("|")]
+        if len(campos) == 3 and campos[2] == modulo:
+            return int(campos[1]) / 1000
+    return 0.0
+
+
+def medir_arranque(modulo):
+    """Mejor tiempo de 'python <modulo>.py --help' en un proceso nuevo e importación."""
+    tiempos = []
+    for _ in range(REPETICIONES_ARRANQUE):
+        inicio = time.perf_counter()
+        subprocess.run([sys.executable, f"{modulo}.py", "--help"], cwd=RAIZ,
+                       capture_output=True, check=True)
+        tiempos.append(time.perf_counter() - inicio)
+    return {
+        "punto_entrada": f"{modulo}.py",
+        "modo": "arranque",
+        "help_ms": round(min(tiempos) * 1000, 1),
+        "importacion_ms": round(min(importacion_ms(modulo) for _ in range(3)), 1),
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmarks sin conexión con Document AI y GCS falsos")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=TAMANOS_POR_DEFECTO,
+                        help="Nº de facturas por ejecución (por defecto 100 1000 10000)")
+    parser.add_argument("--latencia", type=float, default=0.02,
+                        help="Latencia media de process_document en segundos")
+    parser.add_argument("--variacion", type=float, default=0.005,
+                        help="Desviación típica de la latencia")
+    parser.add_argument("--tasa-error", type=float, default=0.0,
+                        help="Fracción de llamadas que fallan con ServiceUnavailable")
+    parser.add_argument("--latencia-descarga", type=float, default=0.0,
+                        help="Latencia de blob.download_as_bytes en segundos")
+    parser.add_argument("--filtro", default="",
+                        help="Solo escenarios cuyo nombre o modo contenga este texto")
+    parser.add_argument("--sin-arranque", action="store_true",
+                        help="No medir el tiempo de arranque de los CLI")
+    parser.add_argument("--json", help="Guardar los resultados en este fichero JSON")
+    return parser.parse_args()
+
+
+def main():
+    opciones = parse_args()
+    resultados = []
+    if not opciones.sin_arranque:
+        # En procesos nuevos y antes de instalar los falsos: mide la importación real
+        print(f"{'punto de entrada':32} {'--help ms':>10} {'import ms':>10}")
+        for modulo in SCRIPTS_ARRANQUE:
+            fila = medir_arranque(modulo)
+            resultados.append(fila)
+            print(f"{fila['punto_entrada']:32} {fila['help_ms']:>10} {fila['importacion_ms']:>10}")
+        print()
+    registro, parametros = instalar_falsos(opciones)
+    print(f"{'punto de entrada':32} {'modo':20} {'n':>6} {'fact/s':>9} {'p50 ms':>8} "
+          f"{'p95 ms':>8} {'pico MB':>8}")
+    for nombre, modo, ejecutar in escenarios(registro, parametros, opciones):
+        if opciones.filtro and opciones.filtro not in f"{nombre} {modo}":
+            continue
+        for n in opciones.tamanos:
+            segundos, pico, error, latencias = ejecutar(n)
+            fila = {
+                "punto_entrada": nombre,
+                "modo": modo,
+                "facturas": n,
+                "segundos": round(segundos, 3),
+                "facturas_por_segundo": round(n / segundos, 1) if segundos else 0.0,
+                "p50_ms": round(percentil(latencias, 50) * 1000, 1),
+                "p95_ms": round(percentil(latencias, 95) * 1000, 1),
+                "pico_memoria_mb": round(pico / 1_048_576, 1),
+                "error": error,
+            }
+            resultados.append(fila)
+            print(f"{nombre:32} {modo:20} {n:>6} {fila['facturas_por_segundo']:>9} "
+                  f"{fila['p50_ms']:>8} {fila['p95_ms']:>8} {fila['pico_memoria_mb']:>8}"
+                  + (f"  ERROR {error}" if error else ""))
+
+    if opciones.json:
+        with open(opciones.json, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+# --- CONFIGURACIÓN ---
+RUTA_CACHE = os.path.join(".cache_docai", "documentos.sqlite")
+MAX_BYTES_CACHE = 500 * 1024 * 1024   # Tamaño máximo antes de expulsar entradas (LRU)
+
+
+class CacheDocAI:
+    """
+    Caché local de resultados de Document AI direccionada por contenido.
+
+    La clave es el SHA-256 de los bytes del PDF más el nombre del processor
+    y las 'opciones' de la petición (páginas enviadas, recompresión), así que
+    el mismo PDF reenviado o resubido no vuelve a pasar por la API, y un
+    Document de solo algunas páginas no se reutiliza con otras opciones.
+    Se guarda el Document completo (serializado y comprimido), no la fila,
+    para que un cambio en el mapeo de entidades siga aprovechando la caché.
+    Cuando el tamaño total supera 'max_bytes' se expulsan las entradas
+    usadas hace más tiempo.
+    """
+
+    def __init__(self, ruta: str = RUTA_CACHE, max_bytes: int = MAX_BYTES_CACHE):
+        if os.path.dirname(ruta):
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        self.ruta = ruta
+        self.max_bytes = max_bytes
+        self.aciertos = 0
+        self.fallos = 0
+        self._lock = threading.Lock()
+        # timeout: en modo --all varios procesos escriben en el mismo fichero
+        self._conn = sqlite3.connect(ruta, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS documentos (
+                   clave TEXT PRIMARY KEY,
+                   datos BLOB NOT NULL,
+                   tamano INTEGER NOT NULL,
+                   ultimo_acceso REAL NOT NULL
+               )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_ultimo_acceso ON documentos (ultimo_acceso)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def clave(content: bytes, processor_name: str, opciones: str = "") -> str:
+        h = hashlib.sha256(content)
+        h.update(processor_name.encode("utf-8"))
+        if opciones:
+            h.update(b"\0" + opciones.encode("utf-8"))
+        return h.hexdigest()
+
+    def obtener(self, content: bytes, processor_name: str, opciones: str = ""):
+        """Devuelve el Document cacheado o None si no está."""
+        from google.cloud import documentai_v1 as documentai
+        clave = self.clave(content, processor_name, opciones)
+        with self._lock:
+            fila = self._conn.execute(
+                "SELECT datos FROM documentos WHERE clave = ?", (clave,)
+            ).fetchone()
+            if fila is None:
+                self.fallos += 1
+                return None
+            self.aciertos += 1
+            self._conn.execute(
+                "UPDATE documentos SET ultimo_acceso = ? WHERE clave = ?", (time.time(), clave)
+            )
+            self._conn.commit()
+        return documentai.Document.deserialize(zlib.decompress(fila[0]))
+
+    def guardar(self, content: bytes, processor_name: str, doc, opciones: str = "") -> None:
+        from google.cloud import documentai_v1 as documentai
+        clave = self.clave(content, processor_name, opciones)
+        datos = zlib.compress(documentai.Document.serialize(doc))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documentos VALUES (?, ?, ?, ?)",
+                (clave, datos, len(datos), time.time()),
+            )
+            self._expulsar()
+            self._conn.commit()
+
+    def procesar(self, content: bytes, processor_name: str, ocr, opciones: str = ""):
+        """
+        Devuelve el Document para 'content'; solo llama a 'ocr(content)'
+        (la petición real a Document AI) si no está en caché.
+        """
+        doc = self.obtener(content, processor_name, opciones)
+        if doc is None:
+            doc = ocr(content)
+            self.guardar(content, processor_name, doc, opciones)
+        return doc
+
+    def _expulsar(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(tamano), 0) FROM documentos").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        filas = self._conn.execute(
+            "SELECT clave, tamano FROM documentos ORDER BY ultimo_acceso"
+        ).fetchall()
+        for clave, tamano in filas:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM documentos WHERE clave = ?", (clave,))
+            total -= tamano
+
+    def resumen(self) -> str:
+        return f"Caché Document AI: {self.aciertos} aciertos, {self.fallos} fallos"
+
+    def cerrar(self) -> None:
+        with self._lock:
+            self._conn.close()
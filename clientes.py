@@ -0,0 +1,34 @@
+import threading
+
+# --- CLIENTES DE GOOGLE (creación diferida) ---
+# Importar google.cloud.documentai/storage y crear los clientes (con la
+# búsqueda de credenciales) cuesta más de un segundo. Los scripts no los
+# crean al importarse sino la primera vez que los necesitan: '--help' o
+# --reextract arrancan al instante, una ejecución sin PDFs pendientes no
+# llega a crear el de Document AI y los módulos se importan sin credenciales.
+
+_lock = threading.Lock()
+_clientes = {}
+
+
+def _crear_una_vez(clave, crear):
+    with _lock:
+        if clave not in _clientes:
+            _clientes[clave] = crear()
+        return _clientes[clave]
+
+
+def cliente_docai():
+    """DocumentProcessorServiceClient compartido por todo el proceso."""
+    def crear():
+        from google.cloud import documentai_v1 as documentai
+        return documentai.DocumentProcessorServiceClient()
+    return _crear_una_vez("docai", crear)
+
+
+def cliente_storage():
+    """storage.Client compartido por todo el proceso."""
+    def crear():
+        from google.cloud import storage as gcs
+        return gcs.Client()
+    return _crear_una_vez("storage", crear)
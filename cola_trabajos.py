@@ -0,0 +1,165 @@
+import collections
+import threading
+import time
+import uuid
+
+# --- COLA DE TRABAJOS EN SEGUNDO PLANO ---
+# La app de Streamlit no procesa las facturas en el hilo de la página. Cada
+# envío de PDFs es un trabajo con identificador que un grupo fijo de hilos
+# atiende archivo a archivo, por turnos entre los trabajos activos: dos
+# usuarios que procesan a la vez se reparten los hilos en lugar de esperar
+# uno al otro. La página solo consulta el estado y las filas obtenidas hasta
+# el momento. Cada trabajo pertenece a una sesión y los terminados se
+# conservan un tiempo para recuperarlos al recargar la página o reconectar.
+
+CONSERVAR_TRABAJOS = 24 * 3600     # Segundos que se guardan los trabajos terminados
+EN_COLA, PROCESANDO, TERMINADO = "en cola", "procesando", "terminado"
+
+
+class Trabajo:
+    """Un envío de PDFs: estado, progreso y filas obtenidas hasta el momento."""
+
+    def __init__(self, sesion: str, archivos: list, contexto):
+        self.id = uuid.uuid4().hex
+        self.sesion = sesion
+        self.contexto = contexto           # Estado propio del trabajo (ver ColaTrabajos)
+        self.total = len(archivos)
+        self.procesadas = 0
+        self.estado = EN_COLA
+        self.creado = time.time()
+        self.terminado = None
+        self.resultado = None              # Lo que devolvió al_terminar()
+        self.errores = []
+        self._por_archivo = {}
+        self._pendientes = collections.deque(
+            (indice, nombre, contenido) for indice, (nombre, contenido) in enumerate(archivos)
+        )
+        self._hecho = threading.Event()
+        self._lock = threading.Lock()
+
+    def filas(self) -> list[dict]:
+        """Filas obtenidas hasta ahora, en el orden de subida de los archivos."""
+        with self._lock:
+            return [f for indice in sorted(self._por_archivo) for f in self._por_archivo[indice]]
+
+    def esperar(self, timeout: float = None) -> bool:
+        """Bloquea hasta que el trabajo termine; False si vence 'timeout'."""
+        return self._hecho.wait(timeout)
+
+    def _registrar(self, indice: int, filas, error) -> bool:
+        """Anota el resultado de un archivo; True si era el último."""
+        with self._lock:
+            if error:
+                self.errores.append(error)
+            elif filas:
+                self._por_archivo[indice] = filas
+            self.procesadas += 1
+            return self.procesadas == self.total
+
+
+class ColaTrabajos:
+    """
+    Hilos que procesan los archivos de los trabajos enviados.
+
+    'procesar(contenido, nombre, contexto)' devuelve (filas, error) de un
+    archivo, como procesar_factura_bytes. 'crear_contexto()' da el estado
+    propio de cada trabajo (contadores, métricas…), y 'al_terminar(trabajo)',
+    si se indica, calcula trabajo.resultado cuando acaba el último archivo.
+    """
+
+    def __init__(self, procesar, hilos: int, crear_contexto=dict, al_terminar=None,
+                 conservar: float = CONSERVAR_TRABAJOS):
+        self.procesar = procesar
+        self.crear_contexto = crear_contexto
+        self.al_terminar = al_terminar
+        self.conservar = conservar
+        self._trabajos = {}                       # id -> Trabajo
+        self._turnos = collections.deque()        # Trabajos con archivos sin repartir
+        self._cerrada = False
+        self._cond = threading.Condition()
+        self._hilos = [threading.Thread(target=self._trabajar, name=f"cola-trabajos-{i}", daemon=True)
+                       for i in range(hilos)]
+        for hilo in self._hilos:
+            hilo.start()
+
+    def enviar(self, sesion: str, archivos) -> str:
+        """Encola los (nombre, bytes) de 'archivos' como un trabajo de 'sesion'; devuelve su id."""
+        trabajo = Trabajo(sesion, list(archivos), self.crear_contexto())
+        with self._cond:
+            self._purgar()
+            self._trabajos[trabajo.id] = trabajo
+            if trabajo.total:
+                self._turnos.append(trabajo)
+                self._cond.notify(trabajo.total)
+        if not trabajo.total:
+            self._terminar(trabajo)
+        return trabajo.id
+
+    def trabajo(self, sesion: str, id_trabajo: str):
+        """El trabajo 'id_trabajo' si es de 'sesion', o None."""
+        with self._cond:
+            trabajo = self._trabajos.get(id_trabajo)
+        return trabajo if trabajo is not None and trabajo.sesion == sesion else None
+
+    def trabajos(self, sesion: str) -> list[Trabajo]:
+        """Trabajos de 'sesion', del más reciente al más antiguo."""
+        with self._cond:
+            self._purgar()
+            propios = [t for t in self._trabajos.values() if t.sesion == sesion]
+        return sorted(propios, key=lambda t: t.creado, reverse=True)
+
+    def olvidar(self, sesion: str) -> None:
+        """Descarta los trabajos terminados de 'sesion' (los activos siguen)."""
+        with self._cond:
+            for id_trabajo, trabajo in list(self._trabajos.items()):
+                if trabajo.sesion == sesion and trabajo.estado == TERMINADO:
+                    del self._trabajos[id_trabajo]
+
+    def cerrar(self) -> None:
+        """Detiene los hilos cuando terminan el archivo en curso."""
+        with self._cond:
+            self._cerrada = True
+            self._cond.notify_all()
+        for hilo in self._hilos:
+            hilo.join()
+
+    def _purgar(self) -> None:
+        limite = time.time() - self.conservar
+        for id_trabajo, trabajo in list(self._trabajos.items()):
+            if trabajo.terminado is not None and trabajo.terminado < limite:
+                del self._trabajos[id_trabajo]
+
+    def _siguiente(self):
+        """(trabajo, índice, nombre, bytes) del próximo archivo, o None al cerrar."""
+        with self._cond:
+            while not self._turnos and not self._cerrada:
+                self._cond.wait()
+            if self._cerrada:
+                return None
+            trabajo = self._turnos.popleft()
+            indice, nombre, contenido = trabajo._pendientes.popleft()
+            if trabajo._pendientes:
+                self._turnos.append(trabajo)      # Su siguiente archivo, después de los demás trabajos
+            trabajo.estado = PROCESANDO
+        return trabajo, indice, nombre, contenido
+
+    def _trabajar(self) -> None:
+        while (siguiente := self._siguiente()) is not None:
+            trabajo, indice, nombre, contenido = siguiente
+            try:
+                filas, error = self.procesar(contenido, nombre, trabajo.contexto)
+            except Exception as e:
+                filas, error = None, f"{nombre}: {e}"
+            del siguiente, contenido               # Los bytes del PDF no se guardan en el trabajo
+            if trabajo._registrar(indice, filas, error):
+                self._terminar(trabajo)
+
+    def _terminar(self, trabajo: Trabajo) -> None:
+        if self.al_terminar is not None:
+            try:
+                trabajo.resultado = self.al_terminar(trabajo)
+            except Exception as e:
+                trabajo.errores.append(f"Al terminar el trabajo: {e}")
+        trabajo.terminado = time.time()
+        trabajo.estado = TERMINADO
+        trabajo._hecho.set()
@@ -0,0 +1,41 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# --- CONCURRENCIA ---
+
+
+def procesar_en_paralelo(elementos, funcion, workers: int = 1):
+    """
+    Aplica 'funcion' a cada elemento de 'elementos' usando un pool acotado
+    de 'workers' hilos que comparten los clientes globales del script.
+
+    Genera tuplas (elemento, resultado, error) en el MISMO orden de entrada,
+    de modo que el Excel resultante no depende de qué llamada termina antes.
+    Como mucho hay 2 * workers tareas en vuelo, así que no se descargan
+    miles de PDFs a memoria aunque 'elementos' sea muy largo.
+    Con workers <= 1 se procesa en el hilo actual, sin pool.
+    """
+    if workers <= 1:
+        for elemento in elementos:
+            try:
+                yield elemento, funcion(elemento), None
+            except Exception as e:
+                yield elemento, None, e
+        return
+
+    max_en_vuelo = workers * 2
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pendientes = deque()
+        for elemento in elementos:
+            pendientes.append((elemento, pool.submit(funcion, elemento)))
+            if len(pendientes) >= max_en_vuelo:
+                yield _resultado(*pendientes.popleft())
+        while pendientes:
+            yield _resultado(*pendientes.popleft())
+
+
+def _resultado(elemento, futuro):
+    try:
+        return elemento, futuro.result(), None
+    except Exception as e:
+        return elemento, None, e
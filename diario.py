@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+import time
+
+# --- DIARIO DE EJECUCIÓN ---
+# Cada factura terminada se añade como una línea JSON a un diario en disco
+# antes de que la ejecución llegue a escribir el Excel. Si el proceso muere a
+# mitad (corte de red, Ctrl-C, excepción), la siguiente ejecución con
+# --resume reproduce el diario y solo envía a Document AI lo que faltaba.
+
+OUTPUT_DIR         = "output_docai"
+FSYNC_CADA         = 50      # Entradas entre fsync (cada línea se vuelca al SO al escribirla)
+FSYNC_SEGUNDOS     = 5.0     # …o segundos desde el último fsync, lo que llegue antes
+
+
+def ruta_diario(cliente: str = None, proyecto: str = None) -> str:
+    return os.path.join(OUTPUT_DIR, f"{cliente or 'todos'}_{proyecto or 'todos'}.diario.jsonl")
+
+
+class Diario:
+    """
+    Diario append-only de facturas completadas: una línea por blob con su
+    'generation'/'md5_hash' y las filas extraídas. Una entrada solo se
+    reutiliza si el blob no ha cambiado desde que se escribió.
+    """
+
+    def __init__(self, ruta: str, reanudar: bool = False,
+                 fsync_cada: int = FSYNC_CADA, fsync_segundos: float = FSYNC_SEGUNDOS):
+        if os.path.dirname(ruta):
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        self.ruta = ruta
+        self.fsync_cada = fsync_cada
+        self.fsync_segundos = fsync_segundos
+        self.entradas = {}
+        if reanudar:
+            self.entradas = self._leer()
+            self._compactar()
+        self.reutilizadas = 0
+        self._pendientes_fsync = 0
+        self._ultimo_fsync = time.monotonic()
+        self._lock = threading.Lock()
+        # Sin --resume el diario anterior se descarta y se empieza de cero
+        self._f = open(ruta, "a" if reanudar else "w", encoding="utf-8")
+
+    def _leer(self) -> dict:
+        entradas = {}
+        if not os.path.exists(self.ruta):
+            return entradas
+        with open(self.ruta, encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    entrada = json.loads(linea)
+                except json.JSONDecodeError:
+                    continue   # Línea a medio escribir cuando se cortó la ejecución
+                entradas[entrada["blob"]] = entrada
+        return entradas
+
+    def _compactar(self) -> None:
+        # Reescribe solo las entradas válidas: así no se añade detrás de una línea cortada
+        temporal = self.ruta + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            for entrada in self.entradas.values():
+                f.write(json.dumps(entrada, ensure_ascii=False, default=str) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, self.ruta)
+
+    @staticmethod
+    def _huella(blob) -> dict:
+        return {"generation": blob.generation, "md5_hash": blob.md5_hash}
+
+    def completado(self, blob) -> bool:
+        entrada = self.entradas.get(blob.name)
+        return entrada is not None and entrada["huella"] == self._huella(blob)
+
+    def registrar(self, blob, filas: list[dict]) -> None:
+        """Añade la factura al diario; seguro entre hilos."""
+        linea = json.dumps({"blob": blob.name, "huella": self._huella(blob), "filas": filas},
+                           ensure_ascii=False, default=str)
+        with self._lock:
+            if self._f.closed:
+                return   # Workers que terminan después de una interrupción
+            self._f.write(linea + "\n")
+            self._f.flush()
+            self._pendientes_fsync += 1
+            if (self._pendientes_fsync >= self.fsync_cada
+                    or time.monotonic() - self._ultimo_fsync >= self.fsync_segundos):
+                self._fsync()
+
+    def _fsync(self) -> None:
+        os.fsync(self._f.fileno())
+        self._pendientes_fsync = 0
+        self._ultimo_fsync = time.monotonic()
+
+    def combinar(self, blobs: list, resultados):
+        """
+        Recorre 'blobs' en orden: los completados salen del diario y el resto
+        de 'resultados', que debe traer los pendientes en ese mismo orden.
+        Genera tuplas (blob, filas, error) como procesar_en_paralelo.
+        """
+        resultados = iter(resultados)
+        for blob in blobs:
+            if self.completado(blob):
+                self.reutilizadas += 1
+                yield blob, self.entradas[blob.name]["filas"], None
+            else:
+                yield next(resultados)
+
+    def cerrar(self) -> None:
+        with self._lock:
+            if not self._f.closed:
+                self._fsync()
+                self._f.close()
+
+    def eliminar(self) -> None:
+        """Borra el diario cuando los resultados ya están en el Excel."""
+        self.cerrar()
+        if os.path.exists(self.ruta):
+            os.remove(self.ruta)
+
+    def resumen(self) -> str:
+        return f"Diario: {self.reutilizadas} facturas recuperadas de una ejecución interrumpida"
@@ -0,0 +1,103 @@
+import io
+
+from concurrencia import procesar_en_paralelo
+
+# --- DIVISIÓN DE PDFs GRANDES ---
+# process_document rechaza los PDFs que superan el límite de páginas online,
+# y los escaneos por lotes suelen llevar decenas de facturas en un solo
+# archivo. Esos PDFs se cortan en memoria en trozos de páginas, los trozos
+# se envían en paralelo y las entidades se reagrupan en una factura por
+# cada nº de factura detectado (flujo_docai.FlujoDocAI.documentos).
+
+MAX_PAGINAS_ONLINE  = 15     # Límite de páginas de process_document (Invoice Processor)
+PAGINAS_POR_TROZO   = 1      # El Invoice Processor da un solo nº de factura por petición:
+                             # solo con una página por trozo se ve dónde empieza cada factura
+TROZOS_EN_PARALELO  = 8
+
+
+def contar_paginas(content: bytes) -> int:
+    """Nº de páginas del PDF, o 0 si no se puede leer (se envía entero)."""
+    from PyPDF2 import PdfReader
+    try:
+        return len(PdfReader(io.BytesIO(content)).pages)
+    except Exception:
+        return 0
+
+
+def dividir_pdf(content: bytes, paginas_por_trozo: int = PAGINAS_POR_TROZO) -> list[tuple[int, bytes]]:
+    """Corta el PDF en memoria. Devuelve [(página_inicial, bytes_del_trozo)], base 0."""
+    from PyPDF2 import PdfReader, PdfWriter
+    lector = PdfReader(io.BytesIO(content))
+    trozos = []
+    for inicio in range(0, len(lector.pages), paginas_por_trozo):
+        escritor = PdfWriter()
+        for pagina in lector.pages[inicio:inicio + paginas_por_trozo]:
+            escritor.add_page(pagina)
+        salida = io.BytesIO()
+        escritor.write(salida)
+        trozos.append((inicio, salida.getvalue()))
+    return trozos
+
+
+def _paginas_documento(doc) -> list[tuple[str, list]]:
+    """[(texto_de_la_página, entidades_de_la_página)] de un Document."""
+    if not doc.pages:
+        return [(doc.text, list(doc.entities))]
+
+    paginas = []
+    for pagina in doc.pages:
+        texto = "".join(
+            doc.text[s.start_index:s.end_index] for s in pagina.layout.text_anchor.text_segments
+        )
+        paginas.append((texto, []))
+    for e in doc.entities:
+        refs = e.page_anchor.page_refs
+        n = refs[0].page if refs else 0
+        paginas[min(n, len(paginas) - 1)][1].append(e)
+    return paginas
+
+
+def unir_trozos(trozos: list[tuple[int, object]]) -> list[tuple[str, object]]:
+    """
+    Reagrupa los Document de los trozos en facturas. Una página con un
+    'invoice_id' distinto del de la factura en curso abre una factura nueva;
+    el resto de páginas se suman a la anterior.
+    Devuelve [(rango_de_páginas, Document)], p. ej. [("1-2", doc), ("3-3", doc)].
+    """
+    from google.cloud import documentai_v1 as documentai
+    facturas = []
+    actual = None
+    for inicio, doc in sorted(trozos, key=lambda t: t[0]):
+        for i, (texto, entidades) in enumerate(_paginas_documento(doc)):
+            num = inicio + i
+            ids = [e.mention_text for e in entidades if e.type_ == "invoice_id" and e.mention_text]
+            if actual is None or (ids and actual["id"] and ids[0] != actual["id"]):
+                actual = {"inicio": num, "id": "", "textos": [], "entidades": []}
+                facturas.append(actual)
+            if ids and not actual["id"]:
+                actual["id"] = ids[0]
+            actual["fin"] = num
+            actual["textos"].append(texto)
+            actual["entidades"].extend(entidades)
+
+    return [
+        (f"{f['inicio'] + 1}-{f['fin'] + 1}",
+         documentai.Document(text="\n".join(f["textos"]), entities=f["entidades"]))
+        for f in facturas
+    ]
+
+
+def procesar_por_trozos(content: bytes, obtener_documento, workers: int = TROZOS_EN_PARALELO):
+    """
+    Divide el PDF, obtiene el Document de cada trozo con 'obtener_documento'
+    en paralelo y devuelve las facturas detectadas como en unir_trozos().
+    """
+    trozos = dividir_pdf(content)
+    documentos = []
+    for (inicio, _), doc, error in procesar_en_paralelo(
+        trozos, lambda t: obtener_documento(t[1]), workers
+    ):
+        if error:
+            raise error
+        documentos.append((inicio, doc))
+    return unir_trozos(documentos)
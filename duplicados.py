@@ -0,0 +1,182 @@
+import asyncio
+import hashlib
+import io
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+# --- DUPLICADOS ---
+# El mismo PDF aparece a menudo en varias carpetas cliente/proyecto. Antes de
+# descargar nada se agrupan los blobs por md5_hash y tamaño de GCS: cada grupo
+# se procesa una vez y sus filas se copian al resto de ubicaciones. Los PDFs
+# casi idénticos (mismo texto en la primera página, p. ej. la misma factura
+# reexportada) se agrupan después de descargarlos por su huella de texto.
+# Al final, un informe lista las facturas con el mismo CIF y nº de factura.
+
+MIN_CARACTERES_HUELLA = 50       # Menos texto que esto = escaneado, sin huella
+MAX_HUELLAS           = 2000     # Documents recordados por huella (LRU)
+RUTA_INFORME          = "output_docai/duplicados.csv"
+
+
+def huella_texto(content: bytes) -> str:
+    """Nº de páginas + hash del texto normalizado de la primera página, o ''."""
+    from PyPDF2 import PdfReader
+    try:
+        lector = PdfReader(io.BytesIO(content))
+        if not lector.pages:
+            return ""
+        texto = lector.pages[0].extract_text() or ""
+    except Exception:
+        return ""
+    normalizado = re.sub(r"\s+", " ", texto).strip().lower()
+    if len(normalizado) < MIN_CARACTERES_HUELLA:
+        return ""
+    return f"{len(lector.pages)}:{hashlib.sha1(normalizado.encode('utf-8')).hexdigest()}"
+
+
+class Deduplicador:
+    """
+    Evita llamadas repetidas a Document AI para copias de un mismo PDF:
+    por md5/tamaño antes de descargar (representantes/expandir) y por
+    huella de texto antes del OCR (obtener/obtener_async).
+    """
+
+    def __init__(self, max_huellas: int = MAX_HUELLAS):
+        self.max_huellas = max_huellas
+        self.copias = 0          # Blobs resueltos con el resultado de otro idéntico
+        self.cercanos = 0        # PDFs resueltos con el Document de otro casi idéntico
+        self._representante = {}
+        self._huellas = OrderedDict()
+        self._lock = threading.Lock()
+
+    # --- Copias exactas (metadatos de GCS) ---
+
+    def representantes(self, blobs: list) -> list:
+        """Primer blob de cada grupo (md5_hash, size), en el orden de 'blobs'."""
+        primeros = {}
+        unicos = []
+        for blob in blobs:
+            clave = (blob.md5_hash, blob.size)
+            if not blob.md5_hash or clave not in primeros:
+                primeros[clave] = blob
+                unicos.append(blob)
+            self._representante[blob.name] = primeros[clave]
+        return unicos
+
+    def representante(self, blob):
+        """Blob cuyo resultado se usa para 'blob' (él mismo si no es una copia)."""
+        return self._representante.get(blob.name, blob)
+
+    def expandir(self, blobs: list, resultados):
+        """
+        Recorre 'blobs' en orden: los representantes toman su resultado de
+        'resultados' (que trae solo los representantes, en el mismo orden) y
+        las copias reciben las filas de su representante con su propio 'Archivo'.
+        Genera tuplas (blob, filas, error) como procesar_en_paralelo.
+        """
+        resultados = iter(resultados)
+        por_representante = {}
+        for blob in blobs:
+            representante = self._representante.get(blob.name, blob)
+            if representante is blob:
+                _, filas, error = por_representante[blob.name] = next(resultados)
+                yield blob, filas, error
+                continue
+            _, filas, error = por_representante[representante.name]
+            self.copias += 1
+            if filas is not None:
+                filas = [{**fila, "Archivo": blob.name} for fila in filas]
+            yield blob, filas, error
+
+    # --- PDFs casi idénticos (huella de texto) ---
+
+    def _reservar(self, huella: str) -> tuple[Future, bool]:
+        with self._lock:
+            futuro = self._huellas.get(huella)
+            if futuro is not None:
+                self._huellas.move_to_end(huella)
+                self.cercanos += 1
+                return futuro, False
+            futuro = self._huellas[huella] = Future()
+            if len(self._huellas) > self.max_huellas:
+                self._huellas.popitem(last=False)
+            return futuro, True
+
+    def _fallo(self, huella: str, futuro: Future, error: Exception) -> None:
+        # Un error no se reutiliza: la siguiente copia vuelve a intentarlo
+        with self._lock:
+            if self._huellas.get(huella) is futuro:
+                del self._huellas[huella]
+        futuro.set_exception(error)
+
+    def obtener(self, content: bytes, obtener_documento):
+        """Document de 'content', reutilizando el de otro PDF con la misma huella."""
+        huella = huella_texto(content)
+        if not huella:
+            return obtener_documento(content)
+        futuro, propio = self._reservar(huella)
+        if not propio:
+            return futuro.result()
+        try:
+            doc = obtener_documento(content)
+        except Exception as e:
+            self._fallo(huella, futuro, e)
+            raise
+        futuro.set_result(doc)
+        return doc
+
+    async def obtener_async(self, content: bytes, obtener_documento):
+        """Como obtener(), para el motor asíncrono ('obtener_documento' es una corrutina)."""
+        huella = await asyncio.to_thread(huella_texto, content)
+        if not huella:
+            return await obtener_documento(content)
+        futuro, propio = self._reservar(huella)
+        if not propio:
+            return await asyncio.wrap_future(futuro)
+        try:
+            doc = await obtener_documento(content)
+        except Exception as e:
+            self._fallo(huella, futuro, e)
+            raise
+        futuro.set_result(doc)
+        return doc
+
+    def resumen(self) -> str:
+        return (f"Duplicados: {self.copias} copias idénticas y {self.cercanos} PDFs casi "
+                f"idénticos sin llamada a Document AI")
+
+
+def _normalizar(valor) -> str:
+    import pandas as pd
+    # NaN/None (columna ausente en parte de las filas) cuentan como vacío, no como "NAN"
+    if not isinstance(valor, str) and pd.isna(valor):
+        return ""
+    return re.sub(r"[\s.\-/]", "", str(valor)).upper()
+
+
+def informe_duplicados(df, ruta: str = RUTA_INFORME) -> int:
+    """
+    Escribe en 'ruta' las filas del DataFrame 'df' que comparten CIF del
+    proveedor y nº de factura (normalizados) en más de un archivo.
+    Devuelve el nº de grupos.
+    """
+    columnas_cif = [c for c in ("CIF Proveedor", "CIF_Proveedor") if c in df.columns]
+    if df.empty or not columnas_cif or "Nº Factura" not in df.columns:
+        return 0
+    # Los dos scripts escriben en el mismo almacén con nombres de columna
+    # distintos: el CIF de cada fila es el de la columna que lo tenga
+    cif = df[columnas_cif[0]].map(_normalizar)
+    for columna in columnas_cif[1:]:
+        cif = cif.mask(cif == "", df[columna].map(_normalizar))
+    numero = df["Nº Factura"].map(_normalizar)
+    claves = cif + "|" + numero
+    validas = (cif != "") & (numero != "")
+    archivos = df["Archivo"].groupby(claves).transform("nunique")
+    duplicadas = df[validas & (archivos > 1)].copy()
+    if duplicadas.empty:
+        return 0
+    duplicadas.insert(0, "Grupo", claves[duplicadas.index].factorize()[0] + 1)
+    duplicadas = duplicadas.sort_values(["Grupo", "Archivo"])
+    duplicadas.to_csv(ruta, index=False)
+    return int(duplicadas["Grupo"].max())
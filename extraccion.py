@@ -0,0 +1,169 @@
+import re
+
+# --- EXTRACCIÓN DE CAMPOS ---
+# Un único mapeo de entidades del Invoice Processor a campos de la factura,
+# compartido por process_with_docai, facturas_app y la app de Streamlit.
+# Cada script solo decide cómo se llaman sus columnas (COLUMNAS_*).
+# Base e IVA salen de net_amount/total_tax_amount; si faltan, de la suma de
+# todas las entidades 'vat' (una por tipo de IVA). Si Document AI no devuelve
+# ni base ni IVA, se buscan en el texto del OCR con un único recorrido de una
+# expresión regular precompilada.
+
+# Tipo de entidad -> campo
+ENTIDADES = {
+    "supplier_name":    "proveedor",
+    "supplier_tax_id":  "cif_proveedor",
+    "supplier_address": "direccion",
+    "supplier_phone":   "telefono",
+    "customer_name":    "cliente",
+    "receiver_name":    "cliente",
+    "customer_tax_id":  "cif_cliente",
+    "receiver_tax_id":  "cif_cliente",
+    "invoice_id":       "numero",
+    "invoice_date":     "fecha",
+    "purchase_order":   "pedido",
+    "net_amount":       "base",
+    "total_tax_amount": "iva",
+    "total_amount":     "total",
+}
+# Propiedades de las entidades compuestas 'vat' y 'line_item' -> campo
+PROPIEDADES = {
+    "vat/amount":            "base",      # Base de un tipo de IVA; se suman todos
+    "vat/tax_amount":        "iva",
+    "line_item/description": "concepto",
+}
+CAMPOS = ("proveedor", "cif_proveedor", "direccion", "telefono", "cliente", "cif_cliente",
+          "numero", "fecha", "pedido", "base", "iva", "total", "concepto")
+
+# Columnas de cada salida -> campo, en el orden del Excel
+COLUMNAS_LOTES = {               # process_with_docai.py
+    "Proveedor":      "proveedor",
+    "CIF_Proveedor":  "cif_proveedor",
+    "Cliente":        "cliente",
+    "CIF_Cliente":    "cif_cliente",
+    "Fecha":          "fecha",
+    "Nº Factura":     "numero",
+    "Base Imponible": "base",
+    "IVA":            "iva",
+    "Total":          "total",
+    "Concepto":       "concepto",
+}
+COLUMNAS_FACTURAS = {            # facturas_app.py y app_lectorfacturas.py
+    "Proveedor":      "proveedor",
+    "Dirección":      "direccion",
+    "Teléfono":       "telefono",
+    "Nº Factura":     "numero",
+    "Fecha Emisión":  "fecha",
+    "Nº Pedido":      "pedido",
+    "Base Imponible": "base",
+    "IVA":            "iva",
+    "Importe Total":  "total",
+    "CIF Proveedor":  "cif_proveedor",
+    "Concepto":       "concepto",
+}
+
+# Texto libre: etiquetas de base imponible, IVA y concepto en una sola alternativa.
+# El % del IVA solo se salta si lleva el signo, y un importe nunca es el propio %.
+# Se busca sobre el texto en minúsculas y cada alternativa empieza por una letra
+# fija (b, i, c, d) fuera de los grupos: así 're' salta en C hasta el siguiente
+# candidato en lugar de probar el patrón entero en cada carácter (con
+# re.IGNORECASE es ~6 veces más lento).
+_IMPORTE = r"\d[\d.,]*\d|\d"
+_LETRA = "a-záéíóúñ"
+_PATRON_TEXTO = re.compile(
+    rf"b(?P<etiqueta_base>ase\s+imponible)(?:[^\d]{{0,40}}?(?P<base>{_IMPORTE}))?"
+    rf"|i(?<![{_LETRA}]i)\.?\s?v\.?\s?a\.?(?![{_LETRA}])"
+    rf"(?:\s*\(?\s*\d{{1,2}}(?:[.,]\d+)?\s*%\s*\)?)?[^\d\n%]{{0,30}}?"
+    rf"(?P<iva>{_IMPORTE})(?![\d.,]*\s*%)"
+    rf"|concepto|descripci[oó]n"
+)
+
+
+def leer_importe(texto: str):
+    """
+    '1.234,56 €', '1,234.56' o '300' -> float, o None si no es un importe. El
+    separador decimal es el último punto o coma seguido de 1 o 2 cifras.
+    """
+    m = re.fullmatch(r"(-?)([\d.,]*?\d)(?:[.,](\d{1,2}))?", re.sub(r"[^\d,.\-]", "", texto))
+    if not m:
+        return None
+    return float(f"{m.group(1)}{re.sub(r'[.,]', '', m.group(2))}.{m.group(3) or 0}")
+
+
+def _sumar_importes(textos: list[str]) -> str:
+    """Suma de los importes de 'textos' con coma decimal, o los textos unidos si alguno no se lee."""
+    valores = [leer_importe(t) for t in textos]
+    if None in valores:
+        return " + ".join(textos)
+    return f"{sum(valores):.2f}".replace(".", ",")
+
+
+def extraer_del_texto(texto: str) -> tuple[str, str, str]:
+    """
+    (base, iva, concepto) del texto del OCR, o cadenas vacías. El concepto
+    es lo que hay entre 'Concepto'/'Descripción' y 'Base imponible' (o el
+    final del texto).
+    """
+    minusculas = texto.lower()
+    if len(minusculas) != len(texto):   # Alguna letra rara cambia de longitud al pasar a minúsculas
+        texto = minusculas
+    base = iva = ""
+    inicio_concepto = fin_concepto = None
+    for m in _PATRON_TEXTO.finditer(minusculas):
+        if m.group("etiqueta_base") is not None:
+            if inicio_concepto is not None and fin_concepto is None:
+                fin_concepto = m.start()
+            if not base and m.group("base"):
+                base = m.group("base")
+        elif m.group("iva") is not None:
+            iva = iva or m.group("iva")
+        elif inicio_concepto is None:
+            inicio_concepto = m.end()
+        if base and iva and fin_concepto is not None:
+            break
+    concepto = ""
+    if inicio_concepto is not None:
+        concepto = texto[inicio_concepto:fin_concepto].strip(" :\n\t")
+    return base, iva, concepto
+
+
+def extraer_campos(doc) -> dict:
+    """Dict campo -> texto (ver CAMPOS) a partir de las entidades de un Document."""
+    campos = dict.fromkeys(CAMPOS, "")
+    desglose = {"base": [], "iva": []}   # Importes de cada entidad 'vat'
+    conceptos = []
+    for e in doc.entities:
+        campo = ENTIDADES.get(e.type_)
+        if campo is not None:
+            campos[campo] = e.mention_text or ""
+            continue
+        for p in e.properties:
+            campo = PROPIEDADES.get(p.type_)
+            if campo == "concepto":
+                if p.mention_text:
+                    conceptos.append(p.mention_text)
+            elif campo is not None and p.mention_text:
+                desglose[campo].append(p.mention_text)
+    campos["concepto"] = " | ".join(conceptos).strip()
+
+    # Sin net_amount/total_tax_amount: la suma de todos los tipos de IVA
+    for campo, textos in desglose.items():
+        if not campos[campo] and textos:
+            campos[campo] = _sumar_importes(textos)
+
+    # Sin base ni IVA en las entidades: se buscan en el texto del OCR
+    if not campos["base"] and not campos["iva"]:
+        base, iva, concepto = extraer_del_texto(doc.text)
+        campos["base"] = base
+        campos["iva"] = iva
+        if not campos["concepto"]:
+            campos["concepto"] = concepto
+    return campos
+
+
+def fila(campos: dict, columnas: dict, nombre_archivo: str) -> dict:
+    """Fila del Excel: 'Archivo' y después cada columna de 'columnas' en su orden."""
+    datos = {"Archivo": nombre_archivo}
+    for columna, campo in columnas.items():
+        datos[columna] = campos[campo]
+    return datos
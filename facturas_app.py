@@ -1,8 +1,22 @@
 import os
-import re
-import pandas as pd
-from google.cloud import documentai_v1 as documentai
-from google.cloud import storage
+import time
+import argparse
+
+from concurrencia import procesar_en_paralelo
+import motor_async
+from clientes import cliente_docai, cliente_storage
+from cache_docai import CacheDocAI
+from texto_local import RutaLocal
+from almacen_resultados import AlmacenResultados
+from indice_bucket import indice_clientes_proyectos, listar_blobs
+from flujo_docai import FlujoDocAI
+from metricas import Metricas
+from planificador_docai import MAX_REINTENTOS, PlanificadorDocAI
+from peticiones_docai import PAGINAS_EXTREMOS, PreparadorPeticiones
+from extraccion import COLUMNAS_FACTURAS, extraer_campos, fila
+from diario import Diario, ruta_diario
+from duplicados import Deduplicador, informe_duplicados, RUTA_INFORME
+from archivo_documentos import ArchivoDocumentos
 
 # --- CONFIGURACIÓN ---
 PROJECT_ID   = "772723410003"
@@ -14,97 +28,84 @@ ERROR_LOG    = "errores_procesamiento.csv"
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-# Inicializar clientes
-docai_client   = documentai.DocumentProcessorServiceClient()
+# Clientes de Google: se crean al primer uso (ver clientes.py)
+docai_client   = None
 processor_name = f"projects/{PROJECT_ID}/locations/{LOCATION}/processors/{PROCESSOR_ID}"
-storage_client = storage.Client()
-bucket         = storage_client.bucket(BUCKET_NAME)
+bucket         = None
+cache          = None   # CacheDocAI; se activa en main_interactivo() salvo --sin-cache
+ruta_local     = None   # RutaLocal; se activa en main_interactivo() salvo --sin-texto-local
+metricas       = Metricas()   # Tiempos por etapa y contadores de la ejecución
+planificador   = PlanificadorDocAI(1)   # Reintentos y límite de peticiones; se ajusta en main_interactivo()
+peticiones     = PreparadorPeticiones()   # Páginas y bytes que se envían; se ajusta en main_interactivo()
+diario         = None   # Diario de facturas terminadas; se abre en main_interactivo()
+deduplicador   = None   # Deduplicador; se activa en main_interactivo() salvo --sin-deduplicar
+archivo        = None   # ArchivoDocumentos; se activa en main_interactivo() salvo --sin-archivo
+flujo          = None   # FlujoDocAI con las piezas anteriores; se crea en main_interactivo()
 
 # --- FUNCIONES AUXILIARES ---
 
-def parse_float_es(valor: str) -> float:
-    """Convierte '1.234,56' a float 1234.56; si falla, devuelve 0.0"""
-    if not valor:
-        return 0.0
-    limpia = re.sub(r"[^\d,\.]", "", valor).replace('.', '').replace(',', '.')
-    try:
-        return float(limpia)
-    except ValueError:
-        return 0.0
+def obtener_docai_client():
+    global docai_client
+    if docai_client is None:
+        docai_client = cliente_docai()
+    return docai_client
+
+
+def obtener_bucket():
+    global bucket
+    if bucket is None:
+        bucket = cliente_storage().bucket(BUCKET_NAME)
+    return bucket
 
 
-def procesar_factura(blob) -> dict:
-    """Procesa una factura PDF y devuelve un dict con los campos solicitados."""
-    content = blob.download_as_bytes()
+def procesar_factura(blob) -> list[dict]:
+    """
+    Procesa un PDF y devuelve un dict con los campos solicitados por cada
+    factura (varias si el PDF supera el límite online y se divide).
+    """
+    with metricas.etapa("descarga"):
+        content = blob.download_as_bytes()
+    metricas.sumar("bytes_descargados", len(content))
     if not content:
         raise ValueError("El archivo está vacío o corrupto")
 
-    raw_doc = documentai.RawDocument(content=content, mime_type="application/pdf")
-    req = documentai.ProcessRequest(name=processor_name, raw_document=raw_doc)
-    res = docai_client.process_document(request=req)
-    doc = res.document
-
-    # Inicializar campos
-    datos = {
-        "Archivo": blob.name,
-        "Proveedor": "",
-        "Dirección": "",
-        "Teléfono": "",
-        "Nº Factura": "",
-        "Fecha Emisión": "",
-        "Nº Pedido": "",
-        "Base Imponible": "",
-        "IVA": "",
-        "Importe Total": "",
-        "CIF Proveedor": "",
-        "Concepto": []
-    }
-
-    # Extraer entidades según tipos deseados
-    for e in doc.entities:
-        text = e.mention_text or ""
-        t = e.type_
-        if t == "supplier_name":
-            datos["Proveedor"] = text
-        elif t == "supplier_address":
-            datos["Dirección"] = text
-        elif t == "supplier_phone":
-            datos["Teléfono"] = text
-        elif t == "supplier_tax_id":
-            datos["CIF Proveedor"] = text
-        elif t == "invoice_id":
-            datos["Nº Factura"] = text
-        elif t == "invoice_date":
-            datos["Fecha Emisión"] = text
-        elif t == "purchase_order":
-            datos["Nº Pedido"] = text
-        elif t == "net_amount":
-            valor = parse_float_es(text)
-            datos["Base Imponible"] = f"{valor:.2f}".replace('.', ',')
-        elif t == "total_tax_amount":
-            valor = parse_float_es(text)
-            datos["IVA"] = f"{valor:.2f}".replace('.', ',')
-        elif t == "total_amount":
-            datos["Importe Total"] = text
-        elif t == "line_item":
-            for p in e.properties:
-                if p.type_.endswith("description"):
-                    datos["Concepto"].append(p.mention_text or "")
-
-    # Unir conceptos en una sola celda
-    datos["Concepto"] = " | ".join(filter(None, datos["Concepto"]))
+    documentos = flujo.documentos(content)
+    archivar(blob, documentos)
+    return datos_de_documentos(documentos, blob.name)
 
-    return datos
+
+def archivar(blob, documentos):
+    """Guarda los Documents del blob en el archivo local para --reextract."""
+    if archivo is not None:
+        with metricas.etapa("archivo"):
+            archivo.guardar(blob, documentos)
+
+
+def datos_de_documentos(documentos, nombre_archivo: str) -> list[dict]:
+    """Un dict por cada (rango_de_páginas, Document); el rango va en 'Páginas'."""
+    facturas = []
+    with metricas.etapa("extraccion"):
+        for paginas, doc in documentos:
+            datos = extraer_datos(doc, nombre_archivo)
+            if paginas:
+                datos["Páginas"] = paginas
+            facturas.append(datos)
+    return facturas
+
+
+def extraer_datos(doc, nombre_archivo: str) -> dict:
+    """Convierte el Document del Invoice Processor en el dict de la factura."""
+    return fila(extraer_campos(doc), COLUMNAS_FACTURAS, nombre_archivo)
 
 
 def guardar_excel(cliente: str, proyecto: str, filas: list[dict]):
     nombre = f"{cliente}_{proyecto}.xlsx"
     ruta   = os.path.join(OUTPUT_DIR, nombre)
 
-    # Crear DataFrame y reordenar columnas para que 'CIF Proveedor' sea la segunda
-    df_nuevo = pd.DataFrame(filas)
+    # Orden de columnas del Excel: 'CIF Proveedor' debe ser la segunda
     columnas_orden = [
         "Archivo",
+        "Páginas",
         "CIF Proveedor",
         "Proveedor",
         "Dirección",
@@ -117,19 +118,16 @@ def guardar_excel(cliente: str, proyecto: str, filas: list[dict]):
         "Importe Total",
         "Concepto"
     ]
-    # Asegurar que todas las columnas existen en el DataFrame
-    columnas_final = [col for col in columnas_orden if col in df_nuevo.columns]
-    df_nuevo = df_nuevo[columnas_final]
-
-    if os.path.exists(ruta):
-        df_exist = pd.read_excel(ruta)
-        # Reordenar también el existente antes de concatenar
-        df_exist = df_exist[columnas_final]
-        df = pd.concat([df_exist, df_nuevo], ignore_index=True)
-    else:
-        df = df_nuevo
-
-    df.to_excel(ruta, index=False)
+
+    # Las filas se fusionan con las existentes en el almacén local (importando
+    # el Excel previo si aún no estaba) y el Excel se escribe una sola vez
+    almacen = AlmacenResultados()
+    with metricas.etapa("guardado"):
+        almacen.importar_excel(cliente, proyecto, ruta)
+        almacen.guardar(cliente, proyecto, filas)
+    with metricas.etapa("exportacion_excel"):
+        almacen.exportar_excel(cliente, proyecto, ruta, columnas_orden)
+    almacen.cerrar()
     print(f"✅ Guardado/actualizado: {ruta}")
 
 
@@ -145,43 +143,170 @@ def seleccionar_opcion(lista, titulo):
             print("Opción inválida, inténtalo de nuevo.")
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Procesador interactivo de facturas con Document AI")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Nº de facturas procesadas en paralelo (por defecto 1)")
+    parser.add_argument("--async", dest="usar_async", action="store_true",
+                        help="Usar el motor asíncrono (cliente async de Document AI)")
+    parser.add_argument("--en-vuelo", type=int, default=motor_async.EN_VUELO_POR_DEFECTO,
+                        help="Máximo de peticiones simultáneas en modo --async")
+    parser.add_argument("--sin-cache", action="store_true",
+                        help="No usar la caché local de resultados de Document AI")
+    parser.add_argument("--sin-texto-local", action="store_true",
+                        help="Enviar siempre a Document AI, aunque el PDF tenga capa de texto")
+    parser.add_argument("--refrescar", action="store_true",
+                        help="Volver a leer del bucket el índice de clientes/proyectos")
+    parser.add_argument("--prometheus", metavar="RUTA",
+                        help="Escribir también las métricas en un textfile de Prometheus")
+    parser.add_argument("--sin-deduplicar", action="store_true",
+                        help="Procesar cada copia de un PDF repetido por separado")
+    parser.add_argument("--sin-archivo", action="store_true",
+                        help="No archivar los Documents de Document AI en output_docai/documentos/")
+    parser.add_argument("--reextract", action="store_true",
+                        help="Rehacer el Excel desde los Documents archivados, sin llamar a GCS ni a Document AI")
+    parser.add_argument("--resume", action="store_true",
+                        help="Reanudar una ejecución interrumpida a partir de su diario")
+    parser.add_argument("--paginas-minuto", type=int,
+                        help="Presupuesto de páginas por minuto para Document AI (por defecto sin límite)")
+    parser.add_argument("--reintentos", type=int, default=MAX_REINTENTOS,
+                        help="Reintentos ante errores de cuota o de sobrecarga de Document AI")
+    parser.add_argument("--paginas-extremos", type=int, default=PAGINAS_EXTREMOS,
+                        help="Enviar a Document AI solo estas primeras y últimas páginas de cada PDF "
+                             f"(por defecto {PAGINAS_EXTREMOS}; 0 = todas)")
+    parser.add_argument("--recomprimir", action="store_true",
+                        help="Reducir las imágenes de los PDFs escaneados muy pesados antes de enviarlos")
+    return parser.parse_args()
+
+
+def _procesar_blob(blob) -> list[dict]:
+    if blob.size == 0:
+        raise ValueError("Archivo vacío")
+    print(f"Procesando {blob.name}...")
+    datos = procesar_factura(blob)
+    diario.registrar(blob, datos)
+    return datos
+
+
+def _datos_al_diario(documentos, blob) -> list[dict]:
+    archivar(blob, documentos)
+    datos = datos_de_documentos(documentos, blob.name)
+    diario.registrar(blob, datos)
+    return datos
+
+
 def main_interactivo():
+    global cache, ruta_local, planificador, peticiones, diario, deduplicador, archivo, flujo
+    args = parse_args()
+    if args.reextract:
+        reextraer()
+        return
+    planificador = PlanificadorDocAI(args.en_vuelo if args.usar_async else args.workers,
+                                     args.paginas_minuto, args.reintentos)
+    peticiones = PreparadorPeticiones(args.paginas_extremos, args.recomprimir)
+    if not args.sin_cache:
+        cache = CacheDocAI()
+    if not args.sin_texto_local:
+        ruta_local = RutaLocal()
+    if not args.sin_deduplicar:
+        deduplicador = Deduplicador()
+    if not args.sin_archivo:
+        archivo = ArchivoDocumentos()
+    flujo = FlujoDocAI(processor_name, obtener_docai_client, planificador, peticiones, metricas,
+                       cache=cache, ruta_local=ruta_local, deduplicador=deduplicador)
     print("🧾 Procesador de facturas con Document AI")
 
-    blobs = list(bucket.list_blobs())
-    clientes = set()
-    proyectos = {}
-    for blob in blobs:
-        if blob.name.lower().endswith(".pdf") and "/" in blob.name:
-            c,p = blob.name.split("/",1)
-            clientes.add(c)
-            proyectos.setdefault(c,set()).add(p.split("/",1)[0])
-
-    clientes = sorted(clientes)
-    proyectos = {c: sorted(proyectos[c]) for c in clientes}
+    # Índice de carpetas cliente/proyecto cacheado en local: no se lista el bucket entero
+    with metricas.etapa("listado"):
+        proyectos = indice_clientes_proyectos(obtener_bucket(), refrescar=args.refrescar)
+    clientes = sorted(proyectos)
 
     cliente  = seleccionar_opcion(clientes, "¿Qué cliente procesar?")
     proyecto = seleccionar_opcion(proyectos[cliente], f"¿Qué proyecto de {cliente}?            ")
 
     filas, errores = [], []
-    for blob in blobs:
-        if not blob.name.startswith(f"{cliente}/{proyecto}/"):
-            continue
-        try:
-            if blob.size == 0:
-                raise ValueError("Archivo vacío")
-            print(f"Procesando {blob.name}...")
-            datos = procesar_factura(blob)
-            filas.append(datos)
-        except Exception as e:
-            errores.append({"Archivo": blob.name, "Error": str(e)})
+    with metricas.etapa("listado"):
+        blobs_proyecto = [b for b in listar_blobs(obtener_bucket(), cliente, proyecto)
+                          if b.name.lower().endswith(".pdf")]
+    diario = Diario(ruta_diario(cliente, proyecto), reanudar=args.resume)
+    # Una sola descarga y OCR por grupo de copias idénticas (md5/tamaño de GCS)
+    unicos = blobs_proyecto
+    if deduplicador is not None:
+        unicos = deduplicador.representantes(blobs_proyecto)
+    pendientes = [b for b in unicos if not diario.completado(b)]
+    try:
+        if args.usar_async:
+            resultados = motor_async.procesar_blobs(pendientes, flujo, _datos_al_diario, args.en_vuelo)
+        else:
+            resultados = procesar_en_paralelo(pendientes, _procesar_blob, args.workers)
+        resultados = diario.combinar(unicos, resultados)
+        if deduplicador is not None:
+            resultados = deduplicador.expandir(blobs_proyecto, resultados)
+        for blob, datos, error in resultados:
+            if error:
+                errores.append({"Archivo": blob.name, "Error": str(error)})
+                continue
+            filas.extend(datos)
+            if archivo is not None and deduplicador is not None:
+                representante = deduplicador.representante(blob)
+                if representante is not blob:
+                    archivo.enlazar(blob, representante)
+    finally:
+        # Ctrl-C o excepción: lo ya terminado queda en disco para --resume
+        diario.cerrar()
+        if archivo is not None:
+            archivo.cerrar()
+    metricas.sumar("facturas_procesadas", len(filas))
+    metricas.sumar("errores", len(errores))
 
     if filas:
         guardar_excel(cliente, proyecto, filas)
+        # Misma factura (CIF + nº) en varios archivos, en todos los clientes y proyectos
+        almacen = AlmacenResultados()
+        grupos = informe_duplicados(almacen.todas())
+        almacen.cerrar()
+        if grupos:
+            print(f"⚠️ {grupos} facturas repetidas en varios archivos: {RUTA_INFORME}")
+    diario.eliminar()
     if errores:
+        import pandas as pd
         pd.DataFrame(errores).to_csv(os.path.join(OUTPUT_DIR, ERROR_LOG), index=False)
         print(f"⚠️ Errores registrados en {ERROR_LOG}")
+    if diario.reutilizadas:
+        print(diario.resumen())
+    flujo.informar(args.prometheus)
     print("✅ Proceso completado.")
 
+def reextraer():
+    """
+    Modo --reextract: rehace el Excel de un cliente/proyecto pasando
+    extraer_datos por los Documents archivados. No usa la red.
+    """
+    archivo_local = ArchivoDocumentos()
+    proyectos = {}
+    for nombre in archivo_local.blobs():
+        partes = nombre.split("/")
+        if len(partes) >= 3:
+            proyectos.setdefault(partes[0], set()).add(partes[1])
+    if not proyectos:
+        print("No hay Documents archivados.")
+        return
+
+    cliente  = seleccionar_opcion(sorted(proyectos), "¿Qué cliente reextraer?")
+    proyecto = seleccionar_opcion(sorted(proyectos[cliente]), f"¿Qué proyecto de {cliente}?")
+    prefijo = f"{cliente}/{proyecto}/"
+
+    inicio = time.perf_counter()
+    nombres = [n for n in archivo_local.blobs() if n.startswith(prefijo)]
+    filas = []
+    for nombre in nombres:
+        filas.extend(datos_de_documentos(archivo_local.documentos(nombre), nombre))
+    archivo_local.cerrar()
+    segundos = time.perf_counter() - inicio
+    print(f"Reextraídos {len(nombres)} PDFs en {segundos:.2f} s "
+          f"({len(nombres) / segundos if segundos else 0:.0f} PDFs/s)")
+    if filas:
+        guardar_excel(cliente, proyecto, filas)
+
 if __name__ == "__main__":
     main_interactivo()
@@ -0,0 +1,186 @@
+import asyncio
+import time
+
+from division_pdf import MAX_PAGINAS_ONLINE, contar_paginas, dividir_pdf, procesar_por_trozos, unir_trozos
+from metricas import Metricas
+from peticiones_docai import opciones_proceso
+
+# --- FLUJO DE UNA FACTURA HASTA DOCUMENT AI ---
+# Cadena común a process_with_docai, facturas_app, app_lectorfacturas y el
+# motor asíncrono: capa de texto del PDF → deduplicador → caché → páginas
+# que se envían → process_document a través del planificador. Aquí se
+# reúnen también los resúmenes y contadores de todas esas piezas.
+#
+# Un PDF de más de MAX_PAGINAS_ONLINE páginas se envía página a página: el
+# Invoice Processor devuelve como mucho un nº de factura por petición, así
+# que solo con una página por petición unir_trozos sabe dónde empieza cada
+# factura.
+
+
+def volcar_metricas(metricas, ruta_prometheus=None) -> None:
+    """Imprime el resumen JSON de 'metricas' y, si se pide, escribe el textfile de Prometheus."""
+    print(metricas.a_json())
+    if ruta_prometheus:
+        metricas.escribir_prometheus(ruta_prometheus)
+
+
+class FlujoDocAI:
+    """
+    Obtiene los Document de los PDFs. 'obtener_cliente()' devuelve el cliente
+    síncrono de Document AI y se llama en cada petición, así los scripts lo
+    crean al primer uso. 'planificador' y 'peticiones' son obligatorios; la
+    caché, la ruta local y el deduplicador se omiten si son None.
+    """
+
+    def __init__(self, processor_name, obtener_cliente, planificador, peticiones, metricas=None,
+                 cache=None, ruta_local=None, deduplicador=None):
+        self.processor_name = processor_name
+        self.obtener_cliente = obtener_cliente
+        self.planificador = planificador
+        self.peticiones = peticiones
+        self.metricas = metricas or Metricas()
+        self.cache = cache
+        self.ruta_local = ruta_local
+        self.deduplicador = deduplicador
+
+    def _peticion(self, content: bytes, paginas):
+        from google.cloud import documentai_v1 as documentai
+        raw_doc = documentai.RawDocument(content=content, mime_type="application/pdf")
+        return documentai.ProcessRequest(name=self.processor_name, raw_document=raw_doc,
+                                         process_options=opciones_proceso(paginas))
+
+    @staticmethod
+    def _paginas_peticion(content: bytes, paginas) -> int:
+        """Páginas que se cobran: las seleccionadas o todas las del PDF (lee el PDF si no las hay)."""
+        return len(paginas) if paginas else max(1, contar_paginas(content))
+
+    def _contar_respuesta(self, content: bytes, respuesta):
+        self.metricas.sumar("bytes_enviados", len(content))
+        self.metricas.sumar("paginas_procesadas", len(respuesta.document.pages))
+        return respuesta.document
+
+    # --- Desde hilos ---
+
+    def enviar_documento(self, content: bytes, paginas=None):
+        """Una llamada a process_document; 'paginas' limita el OCR a esas páginas (base 1)."""
+        req = self._peticion(content, paginas)
+        # El presupuesto de páginas se reserva antes de enviar, con el nº conocido
+        n = self._paginas_peticion(content, paginas)
+        with self.metricas.etapa("document_ai"):
+            res = self.planificador.llamar(lambda: self.obtener_cliente().process_document(request=req),
+                                           paginas=n)
+        return self._contar_respuesta(content, res)
+
+    def ocr_documento(self, content: bytes):
+        """Document AI con solo las primeras/últimas páginas, salvo que falten campos."""
+        return self.peticiones.procesar(content, self.enviar_documento)
+
+    def obtener_documento(self, content: bytes):
+        """Document de la factura: capa de texto del PDF, caché o Document AI, por ese orden."""
+        ocr = self.ocr_documento
+        if self.ruta_local is not None:
+            with self.metricas.etapa("texto_local"):
+                doc = self.ruta_local.documento_local(content)
+            if doc is not None:
+                return doc
+            ocr = self.ruta_local.medir(ocr)
+        consultar = ocr
+        if self.cache is not None:
+            consultar = lambda c: self.cache.procesar(c, self.processor_name, ocr, self.peticiones.opciones())
+        if self.deduplicador is not None:
+            return self.deduplicador.obtener(content, consultar)
+        return consultar(content)
+
+    def documentos(self, content: bytes) -> list[tuple[str, object]]:
+        """
+        [(rango_de_páginas, Document)] de un PDF: un único Document con rango
+        vacío si cabe en una petición online, o una entrada por factura detectada.
+        """
+        if contar_paginas(content) <= MAX_PAGINAS_ONLINE:
+            return [("", self.obtener_documento(content))]
+        return procesar_por_trozos(content, self.obtener_documento)
+
+    # --- Desde el motor asíncrono ---
+
+    async def enviar_documento_async(self, content: bytes, paginas, cliente):
+        """Como enviar_documento(), con el cliente asíncrono del event loop en curso."""
+        req = self._peticion(content, paginas)
+        n = len(paginas) if paginas else await asyncio.to_thread(self._paginas_peticion, content, None)
+        with self.metricas.etapa("document_ai"):
+            res = await self.planificador.llamar_async(lambda: cliente.process_document(request=req),
+                                                       paginas=n)
+        return self._contar_respuesta(content, res)
+
+    async def _consultar_async(self, content: bytes, cliente):
+        # Caché y, si no está, Document AI
+        doc = None
+        if self.cache is not None:
+            doc = await asyncio.to_thread(self.cache.obtener, content, self.processor_name,
+                                          self.peticiones.opciones())
+        if doc is None:
+            inicio = time.perf_counter()
+            doc = await self.peticiones.procesar_async(
+                content, lambda c, paginas: self.enviar_documento_async(c, paginas, cliente)
+            )
+            if self.ruta_local is not None:
+                self.ruta_local.registrar_llamada(time.perf_counter() - inicio)
+            if self.cache is not None:
+                await asyncio.to_thread(self.cache.guardar, content, self.processor_name, doc,
+                                        self.peticiones.opciones())
+        return doc
+
+    async def obtener_documento_async(self, content: bytes, cliente):
+        """Como obtener_documento(); la lectura del PDF y la caché van en hilos."""
+        if self.ruta_local is not None:
+            with self.metricas.etapa("texto_local"):
+                doc = await asyncio.to_thread(self.ruta_local.documento_local, content)
+            if doc is not None:
+                return doc
+        consultar = lambda c: self._consultar_async(c, cliente)
+        if self.deduplicador is not None:
+            return await self.deduplicador.obtener_async(content, consultar)
+        return await consultar(content)
+
+    async def documentos_async(self, content: bytes, cliente) -> list[tuple[str, object]]:
+        """Como documentos(); los trozos de un PDF grande se envían a la vez."""
+        if await asyncio.to_thread(contar_paginas, content) <= MAX_PAGINAS_ONLINE:
+            return [("", await self.obtener_documento_async(content, cliente))]
+        trozos = await asyncio.to_thread(dividir_pdf, content)
+        docs = await asyncio.gather(*(self.obtener_documento_async(t, cliente) for _, t in trozos))
+        return unir_trozos([(i, d) for (i, _), d in zip(trozos, docs)])
+
+    # --- Resumen de la ejecución ---
+
+    def resumenes(self) -> list[str]:
+        """Una línea por pieza activa: caché, ruta local, deduplicador, páginas y planificador."""
+        piezas = (self.cache, self.ruta_local, self.deduplicador, self.peticiones, self.planificador)
+        return [pieza.resumen() for pieza in piezas if pieza is not None]
+
+    def sumar_contadores(self, compartidas: bool = True) -> None:
+        """
+        Pasa a 'metricas' los contadores de las piezas. Con compartidas=False
+        se omiten la caché y el planificador, que en la app comparten todos
+        los trabajos y cuyos contadores no son de uno solo.
+        """
+        metricas = self.metricas
+        if compartidas and self.cache is not None:
+            metricas.sumar("cache_aciertos", self.cache.aciertos)
+            metricas.sumar("cache_fallos", self.cache.fallos)
+        if self.ruta_local is not None:
+            metricas.sumar("facturas_texto_local", self.ruta_local.locales)
+        if self.deduplicador is not None:
+            metricas.sumar("copias_identicas", self.deduplicador.copias)
+            metricas.sumar("pdfs_casi_identicos", self.deduplicador.cercanos)
+        if compartidas:
+            metricas.sumar("reintentos_docai", self.planificador.reintentos)
+            metricas.sumar("recortes_concurrencia", self.planificador.recortes)
+        metricas.sumar("paginas_sin_enviar", self.peticiones.paginas_omitidas)
+        metricas.sumar("peticiones_repetidas_completas", self.peticiones.completas)
+        metricas.sumar("bytes_ahorrados_recompresion", self.peticiones.bytes_ahorrados)
+
+    def informar(self, ruta_prometheus=None) -> None:
+        """Imprime los resúmenes y las métricas de la ejecución (final de los scripts)."""
+        for resumen in self.resumenes():
+            print(resumen)
+        self.sumar_contadores()
+        volcar_metricas(self.metricas, ruta_prometheus)
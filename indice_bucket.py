@@ -0,0 +1,71 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# --- CONFIGURACIÓN ---
+DIR_INDICE  = ".cache_docai"
+TTL_INDICE  = 3600        # Segundos que se reutiliza el índice de carpetas
+PREFIJO_INTERNO = "_"     # Carpetas raíz que no son clientes (p. ej. _docai_lotes de --batch)
+
+
+def listar_carpetas(bucket, prefix: str = "") -> list[str]:
+    """
+    Devuelve los nombres de las subcarpetas directas de 'prefix' usando
+    delimiter="/": GCS solo enumera ese nivel, no todos los objetos debajo.
+    En la raíz se omiten las carpetas internas (PREFIJO_INTERNO).
+    """
+    iterador = bucket.list_blobs(prefix=prefix, delimiter="/")
+    # Hay que recorrer las páginas para que el iterador rellene 'prefixes'
+    for _ in iterador:
+        pass
+    carpetas = sorted(p[len(prefix):].rstrip("/") for p in iterador.prefixes)
+    if not prefix:
+        carpetas = [c for c in carpetas if not c.startswith(PREFIJO_INTERNO)]
+    return carpetas
+
+
+def listar_blobs(bucket, cliente: str = None, proyecto: str = None):
+    """
+    Lista los blobs de un cliente y/o proyecto acotando el listado por prefijo.
+    Sin cliente pero con proyecto, se listan 'cliente/proyecto/' de cada cliente.
+    """
+    if cliente and proyecto:
+        yield from bucket.list_blobs(prefix=f"{cliente}/{proyecto}/")
+    elif cliente:
+        yield from bucket.list_blobs(prefix=f"{cliente}/")
+    elif proyecto:
+        for c in listar_carpetas(bucket):
+            yield from bucket.list_blobs(prefix=f"{c}/{proyecto}/")
+    else:
+        yield from bucket.list_blobs()
+
+
+def construir_indice(bucket, workers: int = 16) -> dict[str, list[str]]:
+    """{cliente: [proyectos]} con una petición por cliente, en paralelo."""
+    clientes = listar_carpetas(bucket)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        proyectos = pool.map(lambda c: listar_carpetas(bucket, f"{c}/"), clientes)
+        return {c: p for c, p in zip(clientes, proyectos) if p}
+
+
+def indice_clientes_proyectos(bucket, ttl: float = TTL_INDICE, refrescar: bool = False,
+                              directorio: str = DIR_INDICE) -> dict[str, list[str]]:
+    """
+    Devuelve el índice {cliente: [proyectos]} del bucket, reutilizando la copia
+    local si tiene menos de 'ttl' segundos, para que el menú aparezca al instante.
+    """
+    ruta = os.path.join(directorio, f"indice_{bucket.name}.json")
+    if not refrescar and os.path.exists(ruta):
+        with open(ruta, encoding="utf-8") as f:
+            guardado = json.load(f)
+        if time.time() - guardado["creado"] < ttl:
+            return guardado["indice"]
+
+    indice = construir_indice(bucket)
+    os.makedirs(directorio, exist_ok=True)
+    temporal = ruta + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump({"creado": time.time(), "indice": indice}, f, ensure_ascii=False)
+    os.replace(temporal, ruta)
+    return indice
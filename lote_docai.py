@@ -0,0 +1,149 @@
+import time
+
+# --- PROCESAMIENTO POR LOTES (batch_process_documents) ---
+# Document AI lee los PDFs directamente de GCS y deja los Document en JSON
+# (uno o varios fragmentos por PDF) bajo un prefijo de salida, así que los
+# PDFs no se descargan ni se vuelven a subir desde esta máquina. Los JSON
+# se borran en cuanto se leen: los Document quedan solo en el archivo local
+# (archivo_documentos). La caché no se usa en este modo: su clave es el
+# SHA-256 de los bytes del PDF, y conocerlo obligaría a descargarlos.
+
+MAX_DOCUMENTOS_LOTE = 1000        # Documentos por operación batch
+INTERVALO_SONDEO    = 15          # Segundos entre comprobaciones de la operación
+TIMEOUT_LOTE        = 6 * 3600    # Segundos máximos de espera a las operaciones
+
+
+def dividir_uri(gcs_uri: str) -> tuple[str, str]:
+    """'gs://bucket/a/b.pdf' -> ('bucket', 'a/b.pdf')"""
+    sin_esquema = gcs_uri[len("gs://"):] if gcs_uri.startswith("gs://") else gcs_uri
+    bucket_name, _, ruta = sin_esquema.partition("/")
+    return bucket_name, ruta
+
+
+def lanzar_lote(docai_client, processor_name: str, gcs_uris: list[str], salida_uri: str):
+    """Envía una operación batch con los PDFs indicados y devuelve la operación."""
+    from google.cloud import documentai_v1 as documentai
+
+    documentos = [
+        documentai.GcsDocument(gcs_uri=uri, mime_type="application/pdf") for uri in gcs_uris
+    ]
+    request = documentai.BatchProcessRequest(
+        name=processor_name,
+        input_documents=documentai.BatchDocumentsInputConfig(
+            gcs_documents=documentai.GcsDocuments(documents=documentos)
+        ),
+        document_output_config=documentai.DocumentOutputConfig(
+            gcs_output_config=documentai.DocumentOutputConfig.GcsOutputConfig(gcs_uri=salida_uri)
+        ),
+    )
+    return docai_client.batch_process_documents(request=request)
+
+
+def esperar_operaciones(operaciones, intervalo: float = INTERVALO_SONDEO,
+                        timeout: float = TIMEOUT_LOTE):
+    """
+    Sondea las operaciones de larga duración hasta que terminen todas.
+    Lanza TimeoutError si se supera 'timeout' segundos (None = sin límite).
+    """
+    inicio = time.monotonic()
+    pendientes = list(operaciones)
+    while pendientes:
+        pendientes = [op for op in pendientes if not op.done()]
+        if not pendientes:
+            break
+        if timeout is not None and time.monotonic() - inicio > timeout:
+            raise TimeoutError(f"{len(pendientes)} operaciones batch sin terminar tras {timeout:.0f} s")
+        print(f"Esperando a {len(pendientes)} operaciones batch...")
+        time.sleep(intervalo)
+
+
+def leer_documento(storage_client, salida_uri: str):
+    """
+    Lee y une los fragmentos JSON de un Document escritos bajo 'salida_uri'.
+    Los offsets de las entidades son globales, así que basta con concatenar
+    el texto de los fragmentos en orden y juntar sus entidades.
+    """
+    from google.cloud import documentai_v1 as documentai
+
+    bucket_name, prefijo = dividir_uri(salida_uri)
+    bucket = storage_client.bucket(bucket_name)
+    fragmentos = []
+    for blob in bucket.list_blobs(prefix=prefijo.rstrip("/") + "/"):
+        if blob.name.endswith(".json"):
+            fragmentos.append(
+                documentai.Document.from_json(blob.download_as_bytes(), ignore_unknown_fields=True)
+            )
+    if not fragmentos:
+        raise ValueError(f"Sin resultados en {salida_uri}")
+    fragmentos.sort(key=lambda d: d.shard_info.shard_index)
+
+    doc = documentai.Document()
+    doc.text = "".join(f.text for f in fragmentos)
+    for f in fragmentos:
+        doc.entities.extend(f.entities)
+        doc.pages.extend(f.pages)
+    return doc
+
+
+def borrar_salida(storage_client, salida_uri: str) -> int:
+    """Borra los JSON escritos bajo 'salida_uri' y devuelve cuántos había."""
+    bucket_name, prefijo = dividir_uri(salida_uri)
+    blobs = list(storage_client.bucket(bucket_name).list_blobs(prefix=prefijo.rstrip("/") + "/"))
+    for blob in blobs:
+        blob.delete()
+    return len(blobs)
+
+
+def resultados_operacion(operacion, storage_client):
+    """
+    Genera (gcs_uri_entrada, Document, error) por cada PDF de una operación batch.
+    """
+    try:
+        operacion.result()
+    except Exception as e:
+        # Si la operación falla entera, los estados individuales dicen qué se procesó
+        print(f"⚠️ Operación batch con errores: {e}")
+    for estado in operacion.metadata.individual_process_statuses:
+        if estado.status.code != 0:
+            yield estado.input_gcs_source, None, RuntimeError(estado.status.message)
+            continue
+        try:
+            yield estado.input_gcs_source, leer_documento(storage_client, estado.output_gcs_destination), None
+        except Exception as e:
+            yield estado.input_gcs_source, None, e
+
+
+def procesar_lote(blobs, bucket_name: str, docai_client, storage_client, processor_name: str,
+                  salida_uri: str, intervalo: float = INTERVALO_SONDEO, timeout: float = TIMEOUT_LOTE):
+    """
+    Procesa 'blobs' con operaciones batch de hasta MAX_DOCUMENTOS_LOTE PDFs,
+    lanzadas todas a la vez. Devuelve tuplas (blob, Document, error) en el
+    orden de 'blobs', igual que procesar_en_paralelo.
+    """
+    blobs = list(blobs)
+    por_uri = {f"gs://{bucket_name}/{b.name}": b for b in blobs}
+    uris = list(por_uri)
+
+    operaciones, destinos = [], []
+    for i in range(0, len(uris), MAX_DOCUMENTOS_LOTE):
+        destino = f"{salida_uri.rstrip('/')}/lote_{int(time.time())}_{i // MAX_DOCUMENTOS_LOTE}/"
+        destinos.append(destino)
+        operaciones.append(lanzar_lote(docai_client, processor_name,
+                                       uris[i:i + MAX_DOCUMENTOS_LOTE], destino))
+    esperar_operaciones(operaciones, intervalo, timeout)
+
+    salidas = {}
+    try:
+        for operacion in operaciones:
+            for uri, doc, error in resultados_operacion(operacion, storage_client):
+                salidas[uri] = (doc, error)
+    finally:
+        # También si la lectura falla: sin borrar, cada ejecución dejaría sus JSON en GCS
+        for destino in destinos:
+            borrar_salida(storage_client, destino)
+
+    resultados = []
+    for uri, blob in por_uri.items():
+        doc, error = salidas.get(uri, (None, RuntimeError("No incluido en la respuesta batch")))
+        resultados.append((blob, doc, error))
+    return resultados
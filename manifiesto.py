@@ -0,0 +1,37 @@
+import json
+import os
+
+
+class Manifiesto:
+    """
+    Registro de los blobs ya volcados a un Excel de salida.
+
+    Se guarda junto al Excel ('Cliente_Proyecto.manifest.json') y asocia
+    cada nombre de blob con su 'generation' y 'md5_hash' de GCS. Un blob
+    solo se vuelve a procesar si es nuevo o si alguno de los dos ha cambiado.
+    """
+
+    def __init__(self, ruta_excel: str):
+        self.ruta = os.path.splitext(ruta_excel)[0] + ".manifest.json"
+        self.entradas = {}
+        if os.path.exists(self.ruta):
+            with open(self.ruta, encoding="utf-8") as f:
+                self.entradas = json.load(f)
+
+    @staticmethod
+    def _huella(blob) -> dict:
+        return {"generation": blob.generation, "md5_hash": blob.md5_hash}
+
+    def pendiente(self, blob) -> bool:
+        """True si el blob no se ha procesado o ha cambiado desde entonces."""
+        return self.entradas.get(blob.name) != self._huella(blob)
+
+    def registrar(self, blob) -> None:
+        self.entradas[blob.name] = self._huella(blob)
+
+    def guardar(self) -> None:
+        # Escritura atómica: un corte a mitad no deja el manifiesto corrupto
+        temporal = self.ruta + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(self.entradas, f, ensure_ascii=False, indent=1, sort_keys=True)
+        os.replace(temporal, self.ruta)
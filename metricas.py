@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# --- MÉTRICAS POR ETAPA ---
+# Cada script mide sus etapas (descarga, Document AI, extracción, guardado…)
+# con Metricas.etapa() y suma contadores (bytes, páginas…). Al final se
+# vuelca un resumen JSON y, opcionalmente, un textfile para Prometheus
+# (node_exporter --collector.textfile).
+
+# Límites superiores (segundos) de los cubos del histograma de latencias
+CUBOS_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class _Etapa:
+    def __init__(self):
+        self.llamadas = 0
+        self.errores = 0
+        self.segundos = 0.0
+        self.muestras = []
+        self.cubos = [0] * (len(CUBOS_LATENCIA) + 1)   # el último es +Inf
+
+    def registrar(self, segundos: float, error: bool) -> None:
+        self.llamadas += 1
+        self.errores += int(error)
+        self.segundos += segundos
+        self.muestras.append(segundos)
+        for i, limite in enumerate(CUBOS_LATENCIA):
+            if segundos <= limite:
+                self.cubos[i] += 1
+                break
+        else:
+            self.cubos[-1] += 1
+
+    def percentil(self, p: float) -> float:
+        if not self.muestras:
+            return 0.0
+        ordenadas = sorted(self.muestras)
+        return ordenadas[min(len(ordenadas) - 1, int(round(p / 100 * (len(ordenadas) - 1))))]
+
+
+class Metricas:
+    """Contadores e histogramas de latencia por etapa, seguros entre hilos."""
+
+    def __init__(self):
+        self.inicio = time.time()
+        self._etapas = {}
+        self._contadores = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def etapa(self, nombre: str):
+        """Mide el bloque como una llamada a la etapa 'nombre' (y si falló)."""
+        inicio = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.registrar(nombre, time.perf_counter() - inicio, error)
+
+    def registrar(self, nombre: str, segundos: float, error: bool = False) -> None:
+        with self._lock:
+            self._etapas.setdefault(nombre, _Etapa()).registrar(segundos, error)
+
+    def sumar(self, contador: str, valor: float = 1) -> None:
+        with self._lock:
+            self._contadores[contador] = self._contadores.get(contador, 0) + valor
+
+    def resumen(self) -> dict:
+        with self._lock:
+            etapas = {
+                nombre: {
+                    "llamadas": e.llamadas,
+                    "errores": e.errores,
+                    "segundos_total": round(e.segundos, 3),
+                    "p50_ms": round(e.percentil(50) * 1000, 1),
+                    "p95_ms": round(e.percentil(95) * 1000, 1),
+                    "max_ms": round(max(e.muestras, default=0.0) * 1000, 1),
+                    "histograma": {
+                        str(limite): n for limite, n in zip(CUBOS_LATENCIA + ("+Inf",), e.cubos)
+                    },
+                }
+                for nombre, e in self._etapas.items()
+            }
+            return {
+                "duracion_s": round(time.time() - self.inicio, 3),
+                "etapas": etapas,
+                "contadores": dict(self._contadores),
+            }
+
+    def a_json(self) -> str:
+        return json.dumps(self.resumen(), ensure_ascii=False, indent=2)
+
+    def escribir_prometheus(self, ruta: str, prefijo: str = "facturas") -> None:
+        """Escribe las métricas en formato de exposición de Prometheus (atómico)."""
+        lineas = [
+            f"# HELP {prefijo}_etapa_segundos Latencia por etapa del procesamiento de facturas",
+            f"# TYPE {prefijo}_etapa_segundos histogram",
+        ]
+        with self._lock:
+            for nombre, e in sorted(self._etapas.items()):
+                acumulado = 0
+                for limite, n in zip(CUBOS_LATENCIA + ("+Inf",), e.cubos):
+                    acumulado += n
+                    lineas.append(f'{prefijo}_etapa_segundos_bucket{{etapa="{nombre}",le="{limite}"}} {acumulado}')
+                lineas.append(f'{prefijo}_etapa_segundos_sum{{etapa="{nombre}"}} {e.segundos:.6f}')
+                lineas.append(f'{prefijo}_etapa_segundos_count{{etapa="{nombre}"}} {e.llamadas}')
+            lineas.append(f"# TYPE {prefijo}_etapa_errores_total counter")
+            for nombre, e in sorted(self._etapas.items()):
+                lineas.append(f'{prefijo}_etapa_errores_total{{etapa="{nombre}"}} {e.errores}')
+            for contador, valor in sorted(self._contadores.items()):
+                lineas.append(f"# TYPE {prefijo}_{contador}_total counter")
+                lineas.append(f"{prefijo}_{contador}_total {valor}")
+
+        temporal = ruta + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            f.write("\n".join(lineas) + "\n")
+        os.replace(temporal, ruta)
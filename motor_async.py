@@ -0,0 +1,72 @@
+import asyncio
+
+# --- MOTOR ASÍNCRONO ---
+# google-cloud-storage no tiene cliente asíncrono: el listado y las descargas
+# se ejecutan en el pool de hilos por defecto con asyncio.to_thread, mientras
+# que el OCR usa DocumentProcessorServiceAsyncClient sobre grpc.aio.
+
+EN_VUELO_POR_DEFECTO = 100
+
+
+async def listar_blobs_async(listar):
+    """Ejecuta 'listar()' (un listado de GCS) sin bloquear el event loop."""
+    return await asyncio.to_thread(lambda: list(listar()))
+
+
+async def procesar_blobs_async(blobs, flujo, extraer, en_vuelo=EN_VUELO_POR_DEFECTO,
+                               docai_client=None):
+    """
+    Descarga y procesa con Document AI cada blob de 'blobs', con como mucho
+    'en_vuelo' facturas a la vez (descarga + OCR). Mientras una factura espera
+    al OCR, las siguientes ya se están descargando.
+
+    'flujo' es el FlujoDocAI del script: ruta local, deduplicador, caché,
+    páginas que se envían, planificador y métricas son los mismos que en el
+    modo con hilos. 'extraer(documentos, blob)' convierte la lista
+    [(rango_de_páginas, Document)] de FlujoDocAI.documentos_async en el
+    resultado del script.
+    Devuelve una lista de tuplas (blob, resultado, error) en el orden de 'blobs'.
+    """
+    from google.cloud import documentai_v1 as documentai
+
+    if docai_client is None:
+        # El cliente asíncrono debe crearse dentro del event loop que lo usa
+        docai_client = documentai.DocumentProcessorServiceAsyncClient()
+    semaforo = asyncio.Semaphore(en_vuelo)
+    metricas = flujo.metricas
+
+    async def procesar_uno(blob):
+        async with semaforo:
+            print(f"Procesando {blob.name}...")
+            with metricas.etapa("descarga"):
+                content = await asyncio.to_thread(blob.download_as_bytes)
+            metricas.sumar("bytes_descargados", len(content))
+            if not content:
+                raise ValueError("El archivo está vacío o corrupto")
+            return extraer(await flujo.documentos_async(content, docai_client), blob)
+
+    blobs = list(blobs)
+    salidas = await asyncio.gather(*(procesar_uno(b) for b in blobs), return_exceptions=True)
+    resultados = []
+    for blob, salida in zip(blobs, salidas):
+        if isinstance(salida, Exception):
+            resultados.append((blob, None, salida))
+        else:
+            resultados.append((blob, salida, None))
+    return resultados
+
+
+async def procesar_bucket_async(listar, filtrar, flujo, extraer, en_vuelo=EN_VUELO_POR_DEFECTO):
+    """Obtiene los blobs con 'listar()', aplica 'filtrar(blobs)' y procesa el resultado."""
+    blobs = await listar_blobs_async(listar)
+    return await procesar_blobs_async(filtrar(blobs), flujo, extraer, en_vuelo)
+
+
+def procesar_bucket(listar, filtrar, flujo, extraer, en_vuelo=EN_VUELO_POR_DEFECTO):
+    """Punto de entrada síncrono para los scripts: ejecuta el motor en un event loop nuevo."""
+    return asyncio.run(procesar_bucket_async(listar, filtrar, flujo, extraer, en_vuelo))
+
+
+def procesar_blobs(blobs, flujo, extraer, en_vuelo=EN_VUELO_POR_DEFECTO):
+    """Como procesar_bucket, pero sobre una lista de blobs ya obtenida."""
+    return asyncio.run(procesar_blobs_async(blobs, flujo, extraer, en_vuelo))
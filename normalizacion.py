@@ -0,0 +1,151 @@
+# --- NORMALIZACIÓN DE RESULTADOS ---
+# Document AI devuelve importes, fechas y CIF tal como aparecen impresos
+# ("1.234,56 €", "5 de marzo de 2024", "b-12.345.678"). Antes de exportar,
+# las columnas de un DataFrame completo se convierten de una vez, con
+# operaciones vectorizadas de pandas (sin bucles por celda), a números,
+# fechas y CIF/NIF canónicos, y se añade la columna 'Cuadra'
+# (Base Imponible + IVA ≈ Total). Un importe o una fecha que no se puede
+# convertir no se pierde: su texto queda en la columna "<columna> (sin convertir)".
+
+COLUMNAS_IMPORTE = ("Base Imponible", "IVA", "Total", "Importe Total")
+COLUMNAS_FECHA   = ("Fecha", "Fecha Emisión")
+COLUMNAS_CIF     = ("CIF_Proveedor", "CIF_Cliente", "CIF Proveedor", "CIF Cliente")
+COLUMNA_CUADRA   = "Cuadra"
+SUFIJO_SIN_CONVERTIR = " (sin convertir)"
+TOLERANCIA_CUADRE = 0.02     # Euros de diferencia admitidos por redondeos
+
+MESES = {
+    "ene": 1, "feb": 2, "mar": 3, "abr": 4, "may": 5, "jun": 6,
+    "jul": 7, "ago": 8, "sep": 9, "set": 9, "oct": 10, "nov": 11, "dic": 12,
+    "jan": 1, "apr": 4, "aug": 8, "dec": 12,
+}
+
+_FECHA_ISO      = r"(?P<a>\d{4})-(?P<m>\d{1,2})-(?P<d>\d{1,2})"
+_FECHA_NUMERICA = r"(?P<d>\d{1,2})-(?P<m>\d{1,2})-(?P<a>\d{2,4})"
+_FECHA_TEXTO    = r"(?P<d>\d{1,2})[\s-]*(?:de\s+)?(?P<m>[a-z]{3})[a-z]*[\s-]*(?:del?\s+)?(?P<a>\d{4})"
+_FECHA_INGLES   = r"(?P<m>[a-z]{3})[a-z]*-?\s+(?P<d>\d{1,2})(?:st|nd|rd|th)?,?\s+(?P<a>\d{4})"
+_MILES_CON_PUNTO = r"-?\d{1,3}(?:\.\d{3})+"
+
+
+def _es_texto(serie):
+    import pandas as pd
+    if pd.api.types.is_string_dtype(serie) and serie.dtype != object:
+        return serie.notna()
+    return serie.map(lambda v: isinstance(v, str))
+
+
+def _por_valor_unico(serie, convertir):
+    """Aplica 'convertir' a los valores distintos de 'serie' y reparte el resultado."""
+    import pandas as pd
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=False)
+    convertidos = convertir(pd.Series(unicos, dtype=object if serie.dtype == object else serie.dtype))
+    return pd.Series(convertidos.to_numpy()[codigos], index=serie.index, name=serie.name)
+
+
+def importes(serie):
+    """
+    Serie float a partir de importes en formato español/europeo ("1.234,56",
+    "1 234,56 €", "-12,5") o anglosajón ("1,234.56"). Los negativos contables,
+    "(123,45)" y "1.234,56-", salen negativos. Lo ilegible queda NaN.
+    """
+    import pandas as pd
+
+    texto = _es_texto(serie)
+    # Valores ya numéricos (p. ej. de un Excel releído) se usan tal cual
+    numeros = pd.to_numeric(serie.where(~texto), errors="coerce").astype(float)
+    s = serie.where(texto, "").astype(str)
+    entre_parentesis = s.str.fullmatch(r"\s*\(\s*[^()\-]*\d[^()\-]*\)\s*", na=False)
+    s = s.str.replace(r"[^\d,.\-]", "", regex=True)
+    s = s.str.replace(r"^(\d[\d,.]*)-$", r"-\1", regex=True).mask(entre_parentesis, "-" + s)
+    # El separador más a la derecha es el decimal; con solo puntos, "1.234" son miles
+    coma_al_final = s.str.contains(r",[\d\-]*$", regex=True)
+    decimal_coma = coma_al_final | (~s.str.contains(",", regex=False)
+                                    & s.str.fullmatch(_MILES_CON_PUNTO))
+    decimal_punto = s.str.contains(r"\.[\d\-]*$", regex=True) & ~decimal_coma
+    s = s.mask(decimal_coma, s.str.replace(".", "", regex=False).str.replace(",", ".", regex=False))
+    s = s.mask(decimal_punto, s.str.replace(",", "", regex=False))
+    return numeros.fillna(pd.to_numeric(s.where(texto), errors="coerce"))
+
+
+def fechas(serie):
+    """
+    Serie datetime a partir de fechas "dd/mm/aaaa", "dd-mm-aa", "aaaa-mm-dd",
+    "5 de marzo de 2024" (día primero) o "March 5, 2024". Lo ilegible queda NaT.
+    """
+    import pandas as pd
+
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie
+    # Las facturas repiten mucho las fechas: cada fecha distinta se analiza una vez
+    return _por_valor_unico(serie, _fechas_unicas)
+
+
+def _fechas_unicas(serie):
+    import pandas as pd
+
+    s = serie.astype(str).str.lower().str.replace(r"[./]", "-", regex=True)
+    partes = s.str.extract(_FECHA_ISO)
+    for patron in (_FECHA_NUMERICA, _FECHA_TEXTO, _FECHA_INGLES):
+        partes = partes.fillna(s.str.extract(patron))
+    mes = pd.to_numeric(partes["m"], errors="coerce").fillna(partes["m"].map(MESES))
+    anio = pd.to_numeric(partes["a"], errors="coerce")
+    anio = anio.mask(anio < 100, anio + 2000)
+    return pd.to_datetime(
+        pd.DataFrame({"year": anio, "month": mes, "day": pd.to_numeric(partes["d"], errors="coerce")}),
+        errors="coerce",
+    )
+
+
+def cifs(serie):
+    """CIF/NIF/NIE en mayúsculas, sin espacios, puntos ni guiones y sin el prefijo 'ES' de VAT."""
+    return _por_valor_unico(serie, _cifs_unicos)
+
+
+def _cifs_unicos(serie):
+    s = serie.fillna("").astype(str).str.upper().str.replace(r"[\s.\-/]", "", regex=True)
+    return s.str.replace(r"^ES(?=[A-Z0-9]\d{7}[A-Z0-9]$)", "", regex=True)
+
+
+def _sin_convertir(original, convertida):
+    """Texto de las celdas con valor que quedaron vacías al convertir, o None si no hay."""
+    vacias = convertida.isna() & original.notna()
+    if not vacias.any():
+        return None
+    fallidas = original[vacias].astype(str).str.strip() != ""
+    if not fallidas.any():
+        return None
+    return original.where(fallidas.reindex(original.index, fill_value=False))
+
+
+def _convertir(df, columna, convertir) -> None:
+    """Convierte 'columna' en su sitio y, si algo no se pudo, añade a su lado el texto original."""
+    original = df[columna]
+    df[columna] = convertir(original)
+    texto = _sin_convertir(original, df[columna])
+    if texto is not None:
+        df.insert(df.columns.get_loc(columna) + 1, columna + SUFIJO_SIN_CONVERTIR, texto)
+
+
+def normalizar_resultados(df):
+    """
+    Copia de 'df' con las columnas de importes en float, las de fecha en
+    datetime y los CIF canónicos, más 'Cuadra' (True/False, vacío si falta
+    algún importe). Si hay importes o fechas ilegibles, su texto queda en
+    "<columna> (sin convertir)". Las columnas que no existan se ignoran.
+    """
+    df = df.copy()
+    for columna in COLUMNAS_IMPORTE:
+        if columna in df.columns:
+            _convertir(df, columna, importes)
+    for columna in COLUMNAS_FECHA:
+        if columna in df.columns:
+            _convertir(df, columna, fechas)
+    for columna in COLUMNAS_CIF:
+        if columna in df.columns:
+            df[columna] = cifs(df[columna])
+
+    total = next((c for c in ("Total", "Importe Total") if c in df.columns), None)
+    if total and {"Base Imponible", "IVA"} <= set(df.columns):
+        diferencia = (df["Base Imponible"] + df["IVA"] - df[total]).abs()
+        df[COLUMNA_CUADRA] = (diferencia <= TOLERANCIA_CUADRE).astype("boolean").mask(diferencia.isna())
+    return df
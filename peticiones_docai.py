@@ -0,0 +1,202 @@
+import asyncio
+import io
+import threading
+
+from division_pdf import contar_paginas
+
+# --- PREPARACIÓN DE LAS PETICIONES A DOCUMENT AI ---
+# Los campos que se extraen (proveedor, CIF, nº, fecha y totales) salen de la
+# primera y la última página, pero Document AI cobra y tarda por cada página
+# enviada. Por defecto solo se procesan las N primeras y las N últimas
+# páginas (ProcessOptions.individual_page_selector); si en la respuesta falta
+# algún campo obligatorio, la petición se repite con el PDF completo. También
+# si hay líneas de detalle (line_item) en las páginas que lindan con las
+# omitidas: la tabla sigue seguramente en ellas y el Concepto quedaría corto.
+# Opcionalmente, los PDFs escaneados muy pesados se recomprimen antes de
+# subirlos: sus imágenes se reducen y se recodifican en JPEG.
+
+PAGINAS_EXTREMOS     = 2                    # Páginas del principio y del final (0 = todas)
+CAMPOS_OBLIGATORIOS  = ("supplier_name", "invoice_id", "invoice_date", "total_amount")
+UMBRAL_RECOMPRESION  = 4 * 1024 * 1024      # Bytes del PDF a partir de los que se recomprime
+LADO_MAXIMO_IMAGEN   = 2000                 # Píxeles del lado mayor (~200 ppp en un A4)
+CALIDAD_JPEG         = 75
+
+
+def paginas_extremos(total: int, n: int = PAGINAS_EXTREMOS):
+    """Páginas (base 1) que se procesan de un PDF de 'total' páginas, o None para todas."""
+    if n <= 0 or total <= 2 * n:
+        return None
+    return list(range(1, n + 1)) + list(range(total - n + 1, total + 1))
+
+
+def opciones_proceso(paginas):
+    """ProcessOptions que limita el OCR a 'paginas', o None para el PDF completo."""
+    if not paginas:
+        return None
+    from google.cloud import documentai_v1 as documentai
+    return documentai.ProcessOptions(
+        individual_page_selector=documentai.ProcessOptions.IndividualPageSelector(pages=paginas)
+    )
+
+
+def faltan_campos(doc, campos=CAMPOS_OBLIGATORIOS) -> bool:
+    presentes = {e.type_ for e in doc.entities if e.mention_text}
+    return any(campo not in presentes for campo in campos)
+
+
+def _pagina_entidad(doc, entidad) -> int:
+    """Nº de página (base 1) del PDF enviado en que está 'entidad', o 0 si no se sabe."""
+    refs = entidad.page_anchor.page_refs
+    i = refs[0].page if refs else 0
+    return doc.pages[i].page_number if i < len(doc.pages) else 0
+
+
+def lineas_cortadas(doc, paginas: list[int]) -> bool:
+    """
+    ¿Tiene 'doc' algún line_item en las páginas seleccionadas contiguas a las
+    omitidas (o en una página desconocida)? 'paginas' es la selección de
+    paginas_extremos(): la mitad del principio y la mitad del final.
+    """
+    mitad = len(paginas) // 2
+    bordes = {0, paginas[mitad - 1], paginas[mitad]}
+    return any(_pagina_entidad(doc, e) in bordes for e in doc.entities if e.type_ == "line_item")
+
+
+def _recomprimir_imagen(imagen, lado_maximo: int, calidad: int) -> bool:
+    """Sustituye en su sitio una imagen del PDF por un JPEG reducido si ocupa menos."""
+    from PIL import Image
+    from PyPDF2.filters import _xobj_to_image
+    from PyPDF2.generic import NameObject, NumberObject
+
+    # Máscaras, transparencias e imágenes de 1 bit (CCITT/JBIG2) ya son pequeñas o no admiten JPEG
+    if (imagen.get("/Subtype") != "/Image" or "/SMask" in imagen or imagen.get("/ImageMask")
+            or imagen.get("/BitsPerComponent", 8) == 1):
+        return False
+    datos = _xobj_to_image(imagen)[1]
+    img = Image.open(io.BytesIO(datos))
+    img.thumbnail((lado_maximo, lado_maximo))
+    img = img.convert("L" if img.mode in ("1", "L") else "RGB")
+    salida = io.BytesIO()
+    img.save(salida, "JPEG", quality=calidad)
+    jpeg = salida.getvalue()
+    if len(jpeg) >= len(imagen._data):
+        return False
+    imagen._data = jpeg
+    for clave in ("/DecodeParms", "/Decode"):
+        imagen.pop(clave, None)
+    imagen[NameObject("/Filter")] = NameObject("/DCTDecode")
+    imagen[NameObject("/Width")] = NumberObject(img.width)
+    imagen[NameObject("/Height")] = NumberObject(img.height)
+    imagen[NameObject("/ColorSpace")] = NameObject("/DeviceGray" if img.mode == "L" else "/DeviceRGB")
+    imagen[NameObject("/BitsPerComponent")] = NumberObject(8)
+    return True
+
+
+def recomprimir_pdf(content: bytes, lado_maximo: int = LADO_MAXIMO_IMAGEN,
+                    calidad: int = CALIDAD_JPEG) -> bytes:
+    """PDF con las imágenes reducidas, o 'content' si no se puede o no queda más pequeño."""
+    from PyPDF2 import PdfReader, PdfWriter
+    try:
+        escritor = PdfWriter()
+        for pagina in PdfReader(io.BytesIO(content)).pages:
+            escritor.add_page(pagina)
+        cambiadas = 0
+        for pagina in escritor.pages:
+            xobjetos = pagina.get("/Resources", {}).get("/XObject")
+            if not xobjetos:
+                continue
+            xobjetos = xobjetos.get_object()
+            for nombre in xobjetos:
+                try:
+                    cambiadas += _recomprimir_imagen(xobjetos[nombre].get_object(), lado_maximo, calidad)
+                except Exception:
+                    continue   # Formato que PyPDF2 o Pillow no saben decodificar (p. ej. JPX)
+        if not cambiadas:
+            return content
+        salida = io.BytesIO()
+        escritor.write(salida)
+    except Exception:
+        return content
+    return salida.getvalue() if salida.tell() < len(content) else content
+
+
+class PreparadorPeticiones:
+    """
+    Decide qué bytes y qué páginas se envían a Document AI por cada PDF.
+    'enviar(content, paginas)' hace la llamada real: 'paginas' es la lista
+    de páginas (base 1) a procesar o None para todas (ver opciones_proceso).
+    """
+
+    def __init__(self, paginas_extremos: int = PAGINAS_EXTREMOS, recomprimir: bool = False,
+                 umbral_recompresion: int = UMBRAL_RECOMPRESION,
+                 campos_obligatorios=CAMPOS_OBLIGATORIOS):
+        self.paginas_extremos = paginas_extremos
+        self.recomprimir = recomprimir
+        self.umbral_recompresion = umbral_recompresion
+        self.campos_obligatorios = campos_obligatorios
+        self.selectivas = 0          # Peticiones con solo las primeras/últimas páginas
+        self.completas = 0           # …que se repitieron enteras (faltaba algún campo o líneas de detalle)
+        self.paginas_omitidas = 0
+        self.recomprimidos = 0
+        self.bytes_ahorrados = 0
+        self._lock = threading.Lock()
+
+    def _sumar(self, **contadores) -> None:
+        with self._lock:
+            for nombre, valor in contadores.items():
+                setattr(self, nombre, getattr(self, nombre) + valor)
+
+    def opciones(self) -> str:
+        """Parámetros que cambian el Document devuelto; van en la clave de la caché."""
+        umbral = self.umbral_recompresion if self.recomprimir else 0
+        return f"paginas_extremos={max(self.paginas_extremos, 0)};recomprimir={umbral}"
+
+    def preparar(self, content: bytes):
+        """(bytes_a_enviar, páginas o None). Lee el PDF: desde async, en un hilo."""
+        if self.recomprimir and len(content) > self.umbral_recompresion:
+            reducido = recomprimir_pdf(content)
+            if len(reducido) < len(content):
+                self._sumar(recomprimidos=1, bytes_ahorrados=len(content) - len(reducido))
+                content = reducido
+        if self.paginas_extremos <= 0:
+            return content, None
+        total = contar_paginas(content)
+        paginas = paginas_extremos(total, self.paginas_extremos)
+        return content, paginas
+
+    def _incompleto(self, doc, paginas: list[int]) -> bool:
+        if faltan_campos(doc, self.campos_obligatorios) or lineas_cortadas(doc, paginas):
+            self._sumar(completas=1)
+            return True
+        # La última página seleccionada es siempre la última del PDF
+        self._sumar(selectivas=1, paginas_omitidas=paginas[-1] - len(paginas))
+        return False
+
+    def procesar(self, content: bytes, enviar):
+        """Document de 'content' con la petición más barata que da los campos obligatorios."""
+        content, paginas = self.preparar(content)
+        if paginas is None:
+            return enviar(content, None)
+        doc = enviar(content, paginas)
+        if self._incompleto(doc, paginas):
+            return enviar(content, None)
+        return doc
+
+    async def procesar_async(self, content: bytes, enviar):
+        """Como procesar(), para el motor asíncrono ('enviar' devuelve una corrutina)."""
+        content, paginas = await asyncio.to_thread(self.preparar, content)
+        if paginas is None:
+            return await enviar(content, None)
+        doc = await enviar(content, paginas)
+        if self._incompleto(doc, paginas):
+            return await enviar(content, None)
+        return doc
+
+    def resumen(self) -> str:
+        texto = (f"Páginas: {self.selectivas} PDFs con solo las {self.paginas_extremos} primeras/"
+                 f"últimas páginas ({self.paginas_omitidas} páginas sin enviar), "
+                 f"{self.completas} repetidos enteros por faltar campos o líneas de detalle")
+        if self.recomprimir:
+            texto += (f", {self.recomprimidos} recomprimidos "
+                      f"({self.bytes_ahorrados / 1_048_576:.1f} MB menos)")
+        return texto
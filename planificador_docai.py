@@ -0,0 +1,197 @@
+import asyncio
+import random
+import threading
+import time
+
+# --- PLANIFICADOR DE PETICIONES A DOCUMENT AI ---
+# Todas las llamadas a process_document pasan por aquí. Los errores de cuota
+# o de sobrecarga se reintentan con espera exponencial con jitter, el nº de
+# peticiones en vuelo se ajusta al estilo AIMD (suma 1 por cada ventana sin
+# errores, se divide por 2 ante un throttling) y, si se configura, se respeta
+# un presupuesto de páginas por minuto.
+
+MAX_REINTENTOS   = 6        # Reintentos por petición antes de darla por fallida
+ESPERA_BASE      = 1.0      # Segundos; la espera máxima del intento n es ESPERA_BASE * 2**n
+ESPERA_MAXIMA    = 60.0
+RAFAGA_SEGUNDOS  = 10       # El presupuesto de páginas admite ráfagas de este nº de segundos
+
+
+def errores_transitorios() -> tuple:
+    """Excepciones de google.api_core que se reintentan (importadas al primer uso)."""
+    from google.api_core import exceptions as gexc
+    return (gexc.ResourceExhausted, gexc.DeadlineExceeded, gexc.ServiceUnavailable)
+
+
+def _paginas_respuesta(respuesta) -> int:
+    """Páginas facturadas de un ProcessResponse (al menos 1)."""
+    documento = getattr(respuesta, "document", None)
+    return max(1, len(getattr(documento, "pages", ()) or ()))
+
+
+class PlanificadorDocAI:
+    """
+    Limita y reintenta las llamadas a Document AI, tanto desde hilos
+    (llamar) como desde el motor asíncrono (llamar_async).
+    'en_vuelo' es el máximo de peticiones simultáneas; el límite efectivo
+    baja a la mitad con cada throttling y vuelve a subir con los éxitos.
+    """
+
+    def __init__(self, en_vuelo: int, paginas_por_minuto: int = None,
+                 max_reintentos: int = MAX_REINTENTOS, espera_base: float = ESPERA_BASE,
+                 espera_maxima: float = ESPERA_MAXIMA):
+        self.max_en_vuelo = max(1, en_vuelo)
+        self.limite = float(self.max_en_vuelo)
+        self.paginas_por_minuto = paginas_por_minuto
+        self.max_reintentos = max_reintentos
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self.en_curso = 0
+        self.reintentos = 0
+        self.recortes = 0
+        self.paginas = 0
+        self._saldo = self._capacidad()
+        self._repuesto = time.monotonic()
+        self._ultimo_recorte = 0.0
+        self._lock = threading.Lock()
+        self._condicion = threading.Condition(self._lock)
+        self._condicion_async = None    # (event loop, asyncio.Condition)
+
+    # --- Presupuesto de páginas (token bucket) ---
+
+    def _capacidad(self) -> float:
+        if not self.paginas_por_minuto:
+            return 0.0
+        return max(1.0, self.paginas_por_minuto * RAFAGA_SEGUNDOS / 60)
+
+    def _reservar_paginas(self, paginas: int) -> float:
+        """Descuenta 'paginas' del saldo y devuelve los segundos que hay que esperar."""
+        if not self.paginas_por_minuto:
+            return 0.0
+        with self._lock:
+            ahora = time.monotonic()
+            tasa = self.paginas_por_minuto / 60
+            self._saldo = min(self._capacidad(), self._saldo + (ahora - self._repuesto) * tasa)
+            self._repuesto = ahora
+            self._saldo -= paginas
+            return -self._saldo / tasa if self._saldo < 0 else 0.0
+
+    def _devolver_paginas(self, paginas: int) -> None:
+        if self.paginas_por_minuto:
+            with self._lock:
+                self._saldo += paginas
+
+    # --- Límite de peticiones en vuelo (AIMD) ---
+
+    def _hay_hueco(self) -> bool:
+        return self.en_curso < int(self.limite)
+
+    def _terminar(self, throttling: bool) -> None:
+        """Libera el hueco y ajusta el límite; se llama con el lock tomado."""
+        self.en_curso -= 1
+        if not throttling:
+            self.limite = min(self.max_en_vuelo, self.limite + 1 / self.limite)
+            return
+        # Las peticiones que fallan a la vez cuentan como un único recorte
+        ahora = time.monotonic()
+        if ahora - self._ultimo_recorte >= self.espera_base:
+            self.limite = max(1.0, self.limite / 2)
+            self.recortes += 1
+            self._ultimo_recorte = ahora
+
+    def _espera_reintento(self, intento: int) -> float:
+        # Full jitter: uniforme entre 0 y el tope exponencial
+        return random.uniform(0, min(self.espera_maxima, self.espera_base * 2 ** intento))
+
+    def _registrar(self, respuesta, estimadas: int) -> None:
+        reales = _paginas_respuesta(respuesta)
+        with self._lock:
+            self.paginas += reales
+        # Solo corrige la reserva si la respuesta trae otro nº de páginas (PDF
+        # ilegible para PyPDF2, páginas que Document AI no procesa…)
+        self._devolver_paginas(estimadas - reales)
+
+    # --- Llamadas ---
+
+    def llamar(self, funcion, paginas: int = 1):
+        """
+        Ejecuta 'funcion()' (una llamada a process_document) desde un hilo.
+        'paginas' son las que se envían: se descuentan del presupuesto antes
+        de la llamada, así una ráfaga de PDFs largos también espera.
+        """
+        transitorios = errores_transitorios()
+        for intento in range(self.max_reintentos + 1):
+            espera = self._reservar_paginas(paginas)
+            if espera:
+                time.sleep(espera)
+            with self._condicion:
+                self._condicion.wait_for(self._hay_hueco)
+                self.en_curso += 1
+            throttling = False
+            try:
+                respuesta = funcion()
+            except transitorios:
+                throttling = True
+                self._devolver_paginas(paginas)
+                if intento == self.max_reintentos:
+                    raise
+            except Exception:
+                self._devolver_paginas(paginas)
+                raise
+            else:
+                self._registrar(respuesta, paginas)
+                return respuesta
+            finally:
+                with self._condicion:
+                    self._terminar(throttling)
+                    self._condicion.notify_all()
+            with self._lock:
+                self.reintentos += 1
+            time.sleep(self._espera_reintento(intento))
+
+    def _obtener_condicion_async(self) -> asyncio.Condition:
+        # Cada asyncio.run() crea un event loop nuevo y la condición queda ligada al suyo
+        loop = asyncio.get_running_loop()
+        if self._condicion_async is None or self._condicion_async[0] is not loop:
+            self._condicion_async = (loop, asyncio.Condition())
+        return self._condicion_async[1]
+
+    async def llamar_async(self, funcion, paginas: int = 1):
+        """Como llamar(), pero 'funcion()' devuelve una corrutina (cliente async)."""
+        condicion = self._obtener_condicion_async()
+        transitorios = errores_transitorios()
+        for intento in range(self.max_reintentos + 1):
+            espera = self._reservar_paginas(paginas)
+            if espera:
+                await asyncio.sleep(espera)
+            async with condicion:
+                await condicion.wait_for(self._hay_hueco)
+                with self._lock:
+                    self.en_curso += 1
+            throttling = False
+            try:
+                respuesta = await funcion()
+            except transitorios:
+                throttling = True
+                self._devolver_paginas(paginas)
+                if intento == self.max_reintentos:
+                    raise
+            except Exception:
+                self._devolver_paginas(paginas)
+                raise
+            else:
+                self._registrar(respuesta, paginas)
+                return respuesta
+            finally:
+                with self._lock:
+                    self._terminar(throttling)
+                async with condicion:
+                    condicion.notify_all()
+            with self._lock:
+                self.reintentos += 1
+            await asyncio.sleep(self._espera_reintento(intento))
+
+    def resumen(self) -> str:
+        presupuesto = f", presupuesto {self.paginas_por_minuto} pág/min" if self.paginas_por_minuto else ""
+        return (f"Document AI: {self.paginas} páginas, {self.reintentos} reintentos, "
+                f"{self.recortes} recortes de concurrencia (límite final "
+                f"{int(self.limite)}/{self.max_en_vuelo}{presupuesto})")
@@ -1,8 +1,25 @@
 import os
-import re
-from google.cloud import documentai_v1 as documentai
-from google.cloud import storage
-import pandas as pd
+import sys
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrencia import procesar_en_paralelo
+from clientes import cliente_docai, cliente_storage
+import motor_async
+from cache_docai import CacheDocAI
+from texto_local import RutaLocal
+from manifiesto import Manifiesto
+from almacen_resultados import AlmacenResultados
+from indice_bucket import indice_clientes_proyectos, listar_blobs
+from flujo_docai import FlujoDocAI, volcar_metricas
+from metricas import Metricas
+from planificador_docai import MAX_REINTENTOS, PlanificadorDocAI
+from peticiones_docai import PAGINAS_EXTREMOS, PreparadorPeticiones
+from extraccion import COLUMNAS_LOTES, extraer_campos, fila
+from diario import Diario, ruta_diario
+from duplicados import Deduplicador, informe_duplicados, RUTA_INFORME
+from archivo_documentos import ArchivoDocumentos, SEGMENTO_ARCHIVO
+from lote_docai import TIMEOUT_LOTE
 
 # --- CONFIGURACIÓN ---
 PROJECT_ID = "772723410003"           # Reemplaza con tu ID de proyecto
@@ -10,178 +27,106 @@ LOCATION = "us"                       # Zona donde esté tu Processor
 PROCESSOR_ID = "dff8117c158462cd"     # ID de tu Invoice Processor
 BUCKET_NAME = "facturasclientes"      # Nombre del bucket con los PDFs
 OUTPUT_DIR = "output_docai"        # Carpeta local para los Excel
+RESUMEN_TODO = "resumen_todo.csv"     # Resumen por cliente/proyecto del modo --all
+ERRORES_TODO = "errores_todo.csv"     # Errores de todos los procesos del modo --all
 
-docai_client = documentai.DocumentProcessorServiceClient()
 name = f"projects/{PROJECT_ID}/locations/{LOCATION}/processors/{PROCESSOR_ID}"
-storage_client = storage.Client()
-bucket = storage_client.bucket(BUCKET_NAME)
+# Los clientes de Google se crean al primer uso (ver clientes.py)
+docai_client = None
+storage_client = None
+bucket = None
+
+cache = None                          # CacheDocAI; se activa en main() salvo --sin-cache
+ruta_local = None                     # RutaLocal; se activa en main() salvo --sin-texto-local
+metricas = Metricas()                 # Tiempos por etapa y contadores de la ejecución
+planificador = PlanificadorDocAI(1)   # Reintentos y límite de peticiones; se ajusta en main()
+peticiones = PreparadorPeticiones()   # Páginas y bytes que se envían; se ajusta en main()
+diario = None                         # Diario de facturas terminadas; se abre en main()
+deduplicador = None                   # Deduplicador; se activa en main() salvo --sin-deduplicar
+archivo = None                        # ArchivoDocumentos; se activa en main() salvo --sin-archivo
+flujo = None                          # FlujoDocAI con las piezas anteriores; se crea en main()
 
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 # --- FUNCIONES AUXILIARES ---
 
-def buscar_en_texto(texto, patron):
+def obtener_docai_client():
+    global docai_client
+    if docai_client is None:
+        docai_client = cliente_docai()
+    return docai_client
+
+def obtener_storage_client():
+    global storage_client
+    if storage_client is None:
+        storage_client = cliente_storage()
+    return storage_client
+
+def obtener_bucket():
+    global bucket
+    if bucket is None:
+        bucket = obtener_storage_client().bucket(BUCKET_NAME)
+    return bucket
+
+def procesar_factura(blob):
+    with metricas.etapa("descarga"):
+        content = blob.download_as_bytes()
+    metricas.sumar("bytes_descargados", len(content))
+    # Los PDFs por encima del límite online se dividen y pueden dar varias facturas
+    documentos = flujo.documentos(content)
+    archivar(blob, documentos)
+    return filas_de_documentos(documentos, blob.name)
+
+def archivar(blob, documentos):
+    """Guarda los Documents del blob en el archivo local para --reextract."""
+    if archivo is not None:
+        with metricas.etapa("archivo"):
+            archivo.guardar(blob, documentos)
+
+def filas_de_documentos(documentos, nombre_archivo):
     """
-    Retorna la primera coincidencia del regex 'patron' en 'texto'.
-    Si no se encuentra, retorna cadena vacía.
+    Filas de todas las facturas de un PDF. 'documentos' es la lista
+    [(rango_de_páginas, Document)]; si el PDF se dividió, cada fila
+    indica en 'Páginas' de qué páginas sale.
     """
-    match = re.search(patron, texto, re.IGNORECASE)
-    return match.group(1).strip() if match else ""
-
-def parse_float_es(valor):
+    filas = []
+    with metricas.etapa("extraccion"):
+        for paginas, doc in documentos:
+            for datos in extraer_filas(doc, nombre_archivo):
+                if paginas:
+                    datos["Páginas"] = paginas
+                filas.append(datos)
+    return filas
+
+def extraer_filas(doc, nombre_archivo):
     """
-    Convierte una cadena con formato español (1.234,56) a float (1234.56).
-    Si no se puede convertir, retorna 0.0
+    Convierte el Document devuelto por el Invoice Processor en la lista
+    de filas del Excel (normalmente 1 fila por factura). Los campos salen
+    de extraccion.py, común a los tres scripts.
     """
-    if not valor:
-        return 0.0
-    # Quitar puntos de miles y cambiar coma decimal por punto
-    valor = valor.replace('.', '').replace(',', '.')
-    try:
-        return float(valor)
-    except:
-        return 0.0
-
-def extraer_del_texto_libre(texto):
-    """
-    Fallback para extraer Base imponible, IVA y Concepto
-    cuando no vengan como entidades del Invoice Processor
-    ni line items. Ajusta patrones según tu formato.
-    """
-    base = buscar_en_texto(texto, r"base\s+imponible\s*[^\d]*(\d+[.,]\d+)")
-    iva = buscar_en_texto(texto, r"(?:iva\s*\(?\d+%?\)?:?|i\s*v\s*a|i\.v\.a\.|i\.v\.a)\s*([0-9.,]+)")
-
-    # Busca la palabra "CONCEPTO" o "DESCRIPCIÓN", y coge lo que haya hasta "BASE IMPONIBLE"
-    concepto = ""
-    texto_upper = texto.upper()
-    if "CONCEPTO" in texto_upper:
-        concepto_split = texto_upper.split("CONCEPTO", 1)[-1]
-        if "BASE IMPONIBLE" in concepto_split:
-            concepto = concepto_split.split("BASE IMPONIBLE")[0].strip()
-        else:
-            concepto = concepto_split.strip()
-    elif "DESCRIPCIÓN" in texto_upper:
-        desc_split = texto_upper.split("DESCRIPCIÓN", 1)[-1]
-        if "BASE IMPONIBLE" in desc_split:
-            concepto = desc_split.split("BASE IMPONIBLE")[0].strip()
-        else:
-            concepto = desc_split.strip()
-
-    return base, iva, concepto
+    return [fila(extraer_campos(doc), COLUMNAS_LOTES, nombre_archivo)]
 
-def procesar_factura(blob):
-    content = blob.download_as_bytes()
-    raw_document = documentai.RawDocument(content=content, mime_type="application/pdf")
-    request = documentai.ProcessRequest(name=name, raw_document=raw_document)
-    result = docai_client.process_document(request=request)
-    doc = result.document
-
-    supplier = ""
-    cif_supplier = ""
-    customer = ""
-    cif_customer = ""
-    invoice_date = ""
-    invoice_id = ""
-    base_global = ""
-    iva_global = ""
-    total_global = ""
-
-    line_items = []
-
-    # 1) Recorremos TODAS las entidades
-    for e in doc.entities:
-        if e.type_ == "supplier_name":
-            supplier = e.mention_text
-        elif e.type_ == "supplier_tax_id":
-            cif_supplier = e.mention_text
-        elif e.type_ == "customer_name":
-            customer = e.mention_text
-        elif e.type_ == "customer_tax_id":
-            cif_customer = e.mention_text
-        elif e.type_ == "invoice_date":
-            invoice_date = e.mention_text
-        elif e.type_ == "invoice_id":
-            invoice_id = e.mention_text
-        elif e.type_ == "total_amount":
-            total_global = e.mention_text
-
-        elif e.type_ == "line_item":
-            line_items.append(e)
-
-        # --- CLAVE: Capturar 'vat' / 'net_amount' si aparece ---
-        elif e.type_ == "vat":
-            # Generalmente 'vat/amount' = base, 'vat/tax_amount' = IVA
-            for prop in e.properties:
-                if prop.type_ == "vat/amount":
-                    base_global = prop.mention_text
-                elif prop.type_ == "vat/tax_amount":
-                    iva_global = prop.mention_text
-
-        elif e.type_ == "net_amount":
-            # A veces 'net_amount' es realmente la base imponible
-            # Si Document AI no devuelve 'vat', podrías usar net_amount como base
-            if not base_global:
-                base_global = e.mention_text
-
-    # 2) Leer line items y unir sus descripciones (si quieres un solo concepto)
-    descripciones = []
-    for line_item in line_items:
-        # Para cada line_item, leemos sus properties
-        desc = []
-        for prop in line_item.properties:
-            if prop.type_ == "line_item/description":
-                desc.append(prop.mention_text)
-
-        if desc:
-            descripciones.append(" ".join(desc))
-
-    concepto_unico = " | ".join(descripciones).strip()
-
-    # 3) Si NO hay 'vat' y 'net_amount', fallback a OCR
-    if not base_global and not iva_global:
-        texto_ocr = doc.text
-        base_fbk, iva_fbk, c_fbk = extraer_del_texto_libre(texto_ocr)
-        if base_fbk:
-            base_global = base_fbk
-        if iva_fbk:
-            iva_global = iva_fbk
-        if not concepto_unico and c_fbk:
-            concepto_unico = c_fbk
-
-    # 4) Construimos la fila
-    fila = {
-        "Archivo": blob.name,
-        "Proveedor": supplier,
-        "CIF_Proveedor": cif_supplier,
-        "Cliente": customer,
-        "CIF_Cliente": cif_customer,
-        "Fecha": invoice_date,
-        "Nº Factura": invoice_id,
-        "Base Imponible": base_global,  # <- se rellena desde e.type_=="vat" > vat/amount
-        "IVA": iva_global,             # <- se rellena desde e.type_=="vat" > vat/tax_amount
-        "Total": total_global,         # <- se rellena desde e.type_=="total_amount"
-        "Concepto": concepto_unico
-    }
-
-    return [fila]
+def ruta_excel(cliente, proyecto):
+    nombre_excel = f"{cliente}_{proyecto}.xlsx"
+    return os.path.join(OUTPUT_DIR, nombre_excel)
 
-def guardar_excel(cliente, proyecto, filas):
+def guardar_resultados(almacen, cliente, proyecto, filas):
     """
-    Guarda o actualiza un Excel por cliente y proyecto.
+    Añade las filas de una factura al almacén local del cliente y proyecto.
     'filas' es la lista de diccionarios (normalmente 1 dict por factura).
+    Si un archivo ya tenía filas, se sustituyen en su misma posición
+    en lugar de duplicarse. El Excel se genera al final con exportar_excel().
     """
-    nombre_excel = f"{cliente}_{proyecto}.xlsx"
-    ruta = os.path.join(OUTPUT_DIR, nombre_excel)
-
-    df_nuevo = pd.DataFrame(filas)
-
-    if os.path.exists(ruta):
-        df_existente = pd.read_excel(ruta)
-        df_final = pd.concat([df_existente, df_nuevo], ignore_index=True)
-    else:
-        df_final = df_nuevo
-
-    df_final.to_excel(ruta, index=False)
+    # Un Excel previo al almacén se importa para no perder sus filas
+    with metricas.etapa("guardado"):
+        almacen.importar_excel(cliente, proyecto, ruta_excel(cliente, proyecto))
+        almacen.guardar(cliente, proyecto, filas)
+
+def exportar_excel(almacen, cliente, proyecto):
+    """Escribe el Excel del cliente y proyecto a partir del almacén local."""
+    ruta = ruta_excel(cliente, proyecto)
+    with metricas.etapa("exportacion_excel"):
+        almacen.exportar_excel(cliente, proyecto, ruta)
     print(f"Guardado/actualizado: {ruta}")
 
 
@@ -202,11 +147,54 @@ def parse_args():
     parser = argparse.ArgumentParser(description="Procesador de facturas con Document AI")
     parser.add_argument("--cliente", help="Nombre del cliente (carpeta raíz)")
     parser.add_argument("--proyecto", help="Nombre del proyecto (subcarpeta)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Nº de facturas procesadas en paralelo (por defecto 1)")
+    parser.add_argument("--async", dest="usar_async", action="store_true",
+                        help="Usar el motor asíncrono (cliente async de Document AI)")
+    parser.add_argument("--en-vuelo", type=int, default=motor_async.EN_VUELO_POR_DEFECTO,
+                        help="Máximo de peticiones simultáneas en modo --async")
+    parser.add_argument("--sin-cache", action="store_true",
+                        help="No usar la caché local de resultados de Document AI")
+    parser.add_argument("--sin-texto-local", action="store_true",
+                        help="Enviar siempre a Document AI, aunque el PDF tenga capa de texto")
+    parser.add_argument("--forzar", action="store_true",
+                        help="Reprocesar también los PDFs que ya figuran en el manifiesto")
+    parser.add_argument("--batch", action="store_true",
+                        help="Usar batch_process_documents: Document AI lee los PDFs de GCS")
+    parser.add_argument("--salida-lote", default=f"gs://{BUCKET_NAME}/_docai_lotes/",
+                        help="Prefijo gs:// donde Document AI deja los resultados en modo --batch; se "
+                             "borran al leerlos (en el bucket de entrada, una carpeta que empiece por '_')")
+    parser.add_argument("--timeout-lote", type=float, default=TIMEOUT_LOTE, metavar="SEGUNDOS",
+                        help="Espera máxima a las operaciones de --batch (por defecto %(default).0f s)")
+    parser.add_argument("--prometheus", metavar="RUTA",
+                        help="Escribir también las métricas en un textfile de Prometheus")
+    parser.add_argument("--sin-deduplicar", action="store_true",
+                        help="Procesar cada copia de un PDF repetido por separado")
+    parser.add_argument("--sin-archivo", action="store_true",
+                        help="No archivar los Documents de Document AI en output_docai/documentos/")
+    parser.add_argument("--reextract", action="store_true",
+                        help="Rehacer las filas desde los Documents archivados, sin llamar a GCS ni a Document AI")
+    parser.add_argument("--all", dest="todo", action="store_true",
+                        help="Procesar todo el bucket repartiendo los clientes/proyectos entre procesos")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count(),
+                        help="Nº de procesos en modo --all (por defecto, uno por núcleo)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Reanudar una ejecución interrumpida a partir de su diario")
+    parser.add_argument("--paginas-minuto", type=int,
+                        help="Presupuesto de páginas por minuto para Document AI (por defecto sin límite)")
+    parser.add_argument("--reintentos", type=int, default=MAX_REINTENTOS,
+                        help="Reintentos ante errores de cuota o de sobrecarga de Document AI")
+    parser.add_argument("--paginas-extremos", type=int, default=PAGINAS_EXTREMOS,
+                        help="Enviar a Document AI solo estas primeras y últimas páginas de cada PDF "
+                             f"(por defecto {PAGINAS_EXTREMOS}; 0 = todas)")
+    parser.add_argument("--recomprimir", action="store_true",
+                        help="Reducir las imágenes de los PDFs escaneados muy pesados antes de enviarlos")
     return parser.parse_args()
-def main():
-    args = parse_args()
-    blobs = bucket.list_blobs()
 
+def filtrar_blobs(blobs, cliente_filtro=None, proyecto_filtro=None):
+    """
+    Devuelve solo los PDFs que coinciden con los filtros de cliente/proyecto.
+    """
     for blob in blobs:
         if not blob.name.lower().endswith(".pdf"):
             continue
@@ -214,14 +202,293 @@ def main():
         cliente, proyecto = obtener_cliente_proyecto(blob.name)
 
         # Filtrar si se han pasado cliente y/o proyecto
+        if cliente_filtro and cliente != cliente_filtro:
+            continue
+        if proyecto_filtro and proyecto != proyecto_filtro:
+            continue
+
+        yield blob
+
+def obtener_manifiesto(manifiestos, cliente, proyecto):
+    clave = (cliente, proyecto)
+    if clave not in manifiestos:
+        manifiestos[clave] = Manifiesto(ruta_excel(cliente, proyecto))
+    return manifiestos[clave]
+
+def filtrar_pendientes(blobs, manifiestos):
+    """Descarta los blobs cuyo generation/md5 ya está en el manifiesto de su Excel."""
+    for blob in blobs:
+        cliente, proyecto = obtener_cliente_proyecto(blob.name)
+        if obtener_manifiesto(manifiestos, cliente, proyecto).pendiente(blob):
+            yield blob
+
+def _procesar_con_log(blob):
+    print(f"Procesando {blob.name}...")
+    filas = procesar_factura(blob)
+    diario.registrar(blob, filas)
+    return filas
+
+def _filas_al_diario(documentos, blob):
+    archivar(blob, documentos)
+    filas = filas_de_documentos(documentos, blob.name)
+    diario.registrar(blob, filas)
+    return filas
+
+def unicos_y_pendientes(blobs):
+    """
+    Un blob por grupo de copias idénticas (md5/tamaño) y, de esos, los que
+    no están ya en el diario: solo estos últimos se procesan.
+    """
+    unicos = deduplicador.representantes(blobs) if deduplicador is not None else blobs
+    return unicos, [b for b in unicos if not diario.completado(b)]
+
+def combinar_resultados(blobs, unicos, resultados):
+    """Completa los resultados de los pendientes con el diario y las copias idénticas."""
+    resultados = diario.combinar(unicos, resultados)
+    if deduplicador is not None:
+        resultados = deduplicador.expandir(blobs, resultados)
+    return resultados
+
+def main():
+    args = parse_args()
+    if args.reextract:
+        reextraer(args)
+    elif args.todo:
+        procesar_todo(args)
+    else:
+        ejecutar(args)
+
+def ejecutar(args, errores=None, segmento_archivo=None):
+    """
+    Procesa el cliente/proyecto de 'args'. Si se pasa la lista 'errores', los
+    PDFs que fallan se anotan en ella y no detienen la ejecución (modo --all);
+    sin ella, el primer error se propaga. Devuelve un resumen de la ejecución.
+    """
+    global cache, ruta_local, planificador, peticiones, diario, deduplicador, archivo, metricas, flujo
+    inicio = time.perf_counter()
+    metricas = Metricas()   # Un proceso de --all ejecuta varios fragmentos seguidos
+    planificador = PlanificadorDocAI(args.en_vuelo if args.usar_async else args.workers,
+                                     args.paginas_minuto, args.reintentos)
+    peticiones = PreparadorPeticiones(args.paginas_extremos, args.recomprimir)
+    if not args.sin_cache:
+        cache = CacheDocAI()
+    if not args.sin_texto_local:
+        ruta_local = RutaLocal()
+    if not args.sin_deduplicar:
+        deduplicador = Deduplicador()
+    if not args.sin_archivo:
+        archivo = ArchivoDocumentos(segmento=segmento_archivo or SEGMENTO_ARCHIVO)
+    flujo = FlujoDocAI(name, obtener_docai_client, planificador, peticiones, metricas,
+                       cache=cache, ruta_local=ruta_local, deduplicador=deduplicador)
+
+    manifiestos = {}
+    almacen = AlmacenResultados()
+    actualizados = {}
+    diario = Diario(ruta_diario(args.cliente, args.proyecto), reanudar=args.resume)
+    try:
+        procesar(args, manifiestos, almacen, actualizados, errores)
+    finally:
+        # Ctrl-C o excepción: lo ya terminado queda en disco para --resume
+        diario.cerrar()
+        if archivo is not None:
+            archivo.cerrar()
+        if cache is not None:
+            cache.cerrar()   # En --all cada fragmento abre la suya; el resumen solo lee contadores
+
+    # Cada Excel se escribe una sola vez, y su manifiesto solo después
+    for (cliente, proyecto), blobs_procesados in actualizados.items():
+        exportar_excel(almacen, cliente, proyecto)
+        manifiesto = obtener_manifiesto(manifiestos, cliente, proyecto)
+        for blob in blobs_procesados:
+            manifiesto.registrar(blob)
+        manifiesto.guardar()
+    diario.eliminar()
+    if errores is None and actualizados:
+        # Misma factura (CIF + nº) en varios archivos, en todo el almacén
+        # (sin facturas nuevas el informe anterior sigue valiendo)
+        grupos = informe_duplicados(almacen.todas())
+        if grupos:
+            print(f"⚠️ {grupos} facturas repetidas en varios archivos: {RUTA_INFORME}")
+    almacen.cerrar()
+
+    if diario.reutilizadas:
+        print(diario.resumen())
+    flujo.informar(args.prometheus)
+    return {
+        "Cliente": args.cliente,
+        "Proyecto": args.proyecto,
+        "PDFs": sum(len(b) for b in actualizados.values()),
+        "Facturas": metricas.resumen()["contadores"].get("facturas_procesadas", 0),
+        "Errores": len(errores or []),
+        "Segundos": round(time.perf_counter() - inicio, 1),
+    }
+
+def procesar(args, manifiestos, almacen, actualizados, errores=None):
+    """Procesa los PDFs pendientes y guarda sus filas en el almacén."""
+
+    # El listado se acota por prefijo: solo se enumeran las carpetas pedidas
+    def listar():
+        return listar_blobs(obtener_bucket(), args.cliente, args.proyecto)
+
+    def seleccionar(blobs):
+        blobs = filtrar_blobs(blobs, args.cliente, args.proyecto)
+        if not args.forzar:
+            blobs = filtrar_pendientes(blobs, manifiestos)
+        return blobs
+
+    if args.batch:
+        blobs = list(seleccionar(listar()))
+        unicos, pendientes = unicos_y_pendientes(blobs)
+        print(f"Enviando {len(pendientes)} facturas en modo batch...")
+        import lote_docai
+        with metricas.etapa("lote_docai"):
+            documentos = lote_docai.procesar_lote(
+                pendientes, BUCKET_NAME, obtener_docai_client(), obtener_storage_client(), name, args.salida_lote,
+                timeout=args.timeout_lote,
+            )
+        resultados = []
+        for blob, doc, error in documentos:
+            filas = _filas_al_diario([("", doc)], blob) if doc is not None else None
+            resultados.append((blob, filas, error))
+        resultados = combinar_resultados(blobs, unicos, resultados)
+    elif args.usar_async:
+        blobs, unicos = [], []
+
+        def seleccionar_pendientes(listado):
+            blobs.extend(seleccionar(listado))
+            unicos_blobs, pendientes = unicos_y_pendientes(blobs)
+            unicos.extend(unicos_blobs)
+            return pendientes
+
+        resultados = motor_async.procesar_bucket(
+            listar, seleccionar_pendientes, flujo, _filas_al_diario, args.en_vuelo
+        )
+        resultados = combinar_resultados(blobs, unicos, resultados)
+    else:
+        blobs = list(seleccionar(listar()))
+        unicos, pendientes = unicos_y_pendientes(blobs)
+        resultados = combinar_resultados(
+            blobs, unicos, procesar_en_paralelo(pendientes, _procesar_con_log, args.workers)
+        )
+
+    # Los resultados llegan en el orden del listado aunque haya varios workers
+    for blob, filas_factura, error in resultados:
+        if error:
+            if errores is None:
+                raise error
+            # Sin entrada en el manifiesto: se reintenta en la siguiente ejecución
+            errores.append({"Archivo": blob.name, "Error": str(error)})
+            continue
+        metricas.sumar("facturas_procesadas", len(filas_factura))
+        if archivo is not None and deduplicador is not None:
+            representante = deduplicador.representante(blob)
+            if representante is not blob:
+                archivo.enlazar(blob, representante)
+        cliente, proyecto = obtener_cliente_proyecto(blob.name)
+        guardar_resultados(almacen, cliente, proyecto, filas_factura)
+        actualizados.setdefault((cliente, proyecto), []).append(blob)
+
+def _ejecutar_fragmento(args):
+    """Ejecuta un cliente/proyecto en un proceso del pool de --all."""
+    errores = []
+    try:
+        resumen = ejecutar(args, errores, segmento_archivo=f"{args.cliente}_{args.proyecto}")
+    except Exception as e:
+        # Fallo del fragmento completo (listado, almacén…): se anota y siguen los demás
+        resumen = {"Cliente": args.cliente, "Proyecto": args.proyecto, "PDFs": 0, "Facturas": 0,
+                   "Errores": 1, "Segundos": 0.0}
+        errores.append({"Archivo": f"{args.cliente}/{args.proyecto}/", "Error": repr(e)})
+    for error in errores:
+        error.update(Cliente=args.cliente, Proyecto=args.proyecto)
+    return resumen, errores
+
+def procesar_todo(args):
+    """
+    Modo --all: reparte el bucket por cliente/proyecto entre 'args.procesos'
+    procesos. Cada fragmento escribe solo su Excel, su manifiesto y su
+    diario; al final se unen los errores y el resumen de todos.
+    """
+    import pandas as pd
+
+    # Siempre se relee el bucket: con el índice cacheado (p. ej. por el menú de
+    # facturas_app) se saltarían los clientes/proyectos creados desde entonces
+    indice = indice_clientes_proyectos(obtener_bucket(), refrescar=True)
+    fragmentos = [(c, p) for c in sorted(indice) for p in indice[c]
+                  if (not args.cliente or c == args.cliente) and (not args.proyecto or p == args.proyecto)]
+    procesos = max(1, min(args.procesos, len(fragmentos)))
+    print(f"Procesando {len(fragmentos)} clientes/proyectos en {procesos} procesos...")
+
+    def argumentos(cliente, proyecto):
+        # La cuota de Document AI es del proyecto de GCP: el presupuesto se reparte
+        # (al menos 1 por proceso: 0 sería sin límite)
+        paginas = max(1, args.paginas_minuto // procesos) if args.paginas_minuto else None
+        return argparse.Namespace(**{**vars(args), "cliente": cliente, "proyecto": proyecto,
+                                     "todo": False, "prometheus": None, "paginas_minuto": paginas})
+
+    resumenes, errores = [], []
+    # 'spawn': cada proceso crea sus propios clientes de gRPC la primera vez que los usa
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=contexto) as pool:
+        futuros = [pool.submit(_ejecutar_fragmento, argumentos(c, p)) for c, p in fragmentos]
+        for futuro in as_completed(futuros):
+            resumen, errores_fragmento = futuro.result()
+            resumenes.append(resumen)
+            errores.extend(errores_fragmento)
+            print(f"[{len(resumenes)}/{len(fragmentos)}] {resumen['Cliente']}/{resumen['Proyecto']}: "
+                  f"{resumen['Facturas']} facturas, {resumen['Errores']} errores")
+
+    resumen = pd.DataFrame(resumenes).sort_values(["Cliente", "Proyecto"])
+    resumen.to_csv(os.path.join(OUTPUT_DIR, RESUMEN_TODO), index=False)
+    ruta_errores = os.path.join(OUTPUT_DIR, ERRORES_TODO)
+    if errores:
+        pd.DataFrame(errores, columns=["Cliente", "Proyecto", "Archivo", "Error"]).to_csv(
+            ruta_errores, index=False
+        )
+        print(f"⚠️ {len(errores)} errores registrados en {ruta_errores}")
+    elif os.path.exists(ruta_errores):
+        os.remove(ruta_errores)   # Sin errores: no dejar el log de una ejecución anterior
+
+    almacen = AlmacenResultados()
+    grupos = informe_duplicados(almacen.todas())
+    almacen.cerrar()
+    if grupos:
+        print(f"⚠️ {grupos} facturas repetidas en varios archivos: {RUTA_INFORME}")
+    print(resumen.to_string(index=False))
+    print(f"Total: {resumen['PDFs'].sum()} PDFs, {resumen['Facturas'].sum()} facturas, "
+          f"{len(errores)} errores")
+    if errores:
+        sys.exit(1)
+
+def reextraer(args):
+    """
+    Modo --reextract: vuelve a pasar extraer_filas por los Documents
+    archivados (filtrados por --cliente/--proyecto) y regenera los Excels.
+    No descarga nada ni llama a Document AI.
+    """
+    archivo_local = ArchivoDocumentos()
+    almacen = AlmacenResultados()
+    por_proyecto = {}
+    n = 0
+    inicio = time.perf_counter()
+    for nombre in archivo_local.blobs():
+        cliente, proyecto = obtener_cliente_proyecto(nombre)
         if args.cliente and cliente != args.cliente:
             continue
         if args.proyecto and proyecto != args.proyecto:
             continue
-
-        print(f"Procesando {blob.name}...")
-        filas_factura = procesar_factura(blob)
-        guardar_excel(cliente, proyecto, filas_factura)
+        filas = filas_de_documentos(archivo_local.documentos(nombre), nombre)
+        por_proyecto.setdefault((cliente, proyecto), []).extend(filas)
+        n += 1
+    archivo_local.cerrar()
+    segundos = time.perf_counter() - inicio
+    print(f"Reextraídos {n} PDFs en {segundos:.2f} s ({n / segundos if segundos else 0:.0f} PDFs/s)")
+
+    # Una sola escritura en el almacén y un solo Excel por cliente y proyecto
+    for (cliente, proyecto), filas in por_proyecto.items():
+        guardar_resultados(almacen, cliente, proyecto, filas)
+        exportar_excel(almacen, cliente, proyecto)
+    almacen.cerrar()
+    volcar_metricas(metricas, args.prometheus)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,293 @@
+import io
+import re
+import threading
+import time
+from datetime import datetime
+
+from extraccion import extraer_del_texto, leer_importe
+
+# --- RUTA LOCAL (capa de texto del PDF) ---
+# Muchas facturas de proveedor son PDFs generados digitalmente con el texto
+# embebido. Si de ese texto se extraen con garantías los campos obligatorios,
+# la factura no se envía a Document AI. Base, IVA y concepto se leen con
+# las mismas expresiones que el respaldo de extraccion para el texto del OCR.
+
+MAX_PAGINAS_LOCAL       = 10     # PDFs más largos van siempre a Document AI
+MIN_CARACTERES_TEXTO    = 50     # Menos texto que esto = PDF escaneado
+LATENCIA_API_ESTIMADA   = 3.0    # Segundos por llamada si aún no se ha medido ninguna
+LINEAS_BLOQUE_CLIENTE   = 4      # Líneas (etiqueta incluida) que se atribuyen al cliente
+
+NUM = r"(\d{1,3}(?:[.\s]\d{3})+,\d{2}|\d+,\d{2})"
+
+PATRON_CIF = re.compile(
+    r"\b([ABCDEFGHJNPQRSUVW][-\s]?\d{7}[-\s]?[0-9A-J]|[XYZ][-\s]?\d{7}[-\s]?[A-Z]|\d{8}[-\s]?[A-Z])\b"
+)
+PATRON_NUMERO = re.compile(
+    r"(?:n[º°o]\.?\s*(?:de\s+)?factura|factura\s*(?:n[º°o]\.?|n[uú]m(?:ero)?\.?)?|invoice\s*(?:no\.?|number|#)?)"
+    r"\s*:?\s*([A-Z0-9][A-Z0-9\-/.]*\d[A-Z0-9\-/]*)",
+    re.IGNORECASE,
+)
+PATRON_FECHA = re.compile(
+    r"fecha(?:\s+(?:de\s+)?(?:factura|emisi[oó]n|expedici[oó]n))?\s*:?\s*(\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4})",
+    re.IGNORECASE,
+)
+PATRON_TOTAL = re.compile(
+    r"\btotal\b(?!\s*(?:base|iva|bruto|neto))\s*(?:factura|a\s+pagar)?\s*:?\s*(?:€|eur)?\s*" + NUM,
+    re.IGNORECASE,
+)
+PATRON_SOLO_FECHA = re.compile(r"\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}")
+PATRON_CLIENTE = re.compile(
+    r"\b(?:cliente|facturar\s+a|facturado\s+a|destinatario|bill\s+to|customer)\b", re.IGNORECASE
+)
+PATRON_FORMA_JURIDICA = re.compile(r"\b(S\.?L\.?U?|S\.?A\.?U?|S\.?COOP\.?|S\.?L\.?L\.?)\s*$", re.IGNORECASE)
+PATRON_DIRECCION = re.compile(
+    r"\b(?:c/|calle|avda?\.|avenida|plaza|pza\.|paseo|camino|carretera|ctra\.|pol[ií]gono|ronda"
+    r"|traves[ií]a|rambla)|\b\d{5}\b",
+    re.IGNORECASE,
+)
+
+
+def extraer_texto_pdf(content: bytes) -> str:
+    """Texto embebido del PDF, o cadena vacía si no tiene (o no se puede leer)."""
+    from PyPDF2 import PdfReader
+    try:
+        lector = PdfReader(io.BytesIO(content))
+        if len(lector.pages) > MAX_PAGINAS_LOCAL:
+            return ""
+        return "\n".join(pagina.extract_text() or "" for pagina in lector.pages)
+    except Exception:
+        return ""
+
+
+def validar_cif_nif(valor: str) -> bool:
+    """Comprueba el dígito/letra de control de un CIF, NIF o NIE."""
+    valor = re.sub(r"[-\s]", "", valor).upper()
+    letras_nif = "TRWAGMYFPDXBNJZSQVHLCKE"
+    if re.fullmatch(r"\d{8}[A-Z]", valor):
+        return letras_nif[int(valor[:8]) % 23] == valor[8]
+    if re.fullmatch(r"[XYZ]\d{7}[A-Z]", valor):
+        numero = str("XYZ".index(valor[0])) + valor[1:8]
+        return letras_nif[int(numero) % 23] == valor[8]
+    if re.fullmatch(r"[ABCDEFGHJNPQRSUVW]\d{7}[0-9A-J]", valor):
+        digitos = [int(d) for d in valor[1:8]]
+        pares = sum(digitos[1::2])
+        impares = sum(sum(divmod(2 * d, 10)) for d in digitos[0::2])
+        control = (10 - (pares + impares) % 10) % 10
+        return valor[8] in (str(control), "JABCDEFGHI"[control])
+    return False
+
+
+def fecha_valida(valor: str) -> bool:
+    for formato in ("%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%d/%m/%y", "%d-%m-%y", "%d.%m.%y"):
+        try:
+            datetime.strptime(valor, formato)
+            return True
+        except ValueError:
+            continue
+    return False
+
+
+def _separar_bloques(texto: str) -> tuple[list[str], list[str]]:
+    """
+    (líneas del emisor, líneas del bloque del cliente). Cada línea con una
+    etiqueta de cliente ("Cliente", "Facturar a", "Destinatario"…) y las
+    siguientes hasta completar LINEAS_BLOQUE_CLIENTE son del cliente.
+    """
+    emisor, cliente = [], []
+    restantes = 0
+    for linea in texto.splitlines():
+        if PATRON_CLIENTE.search(linea):
+            restantes = LINEAS_BLOQUE_CLIENTE
+        if restantes:
+            restantes -= 1
+            cliente.append(linea)
+            continue
+        emisor.append(linea)
+    return emisor, cliente
+
+
+def _cif_emisor(texto_emisor: str) -> str:
+    """
+    El CIF/NIF válido del emisor, o "" si no hay ninguno o hay varios
+    distintos (sin saber cuál es el del proveedor, decide Document AI).
+    """
+    validos = {}
+    for m in PATRON_CIF.finditer(texto_emisor):
+        if validar_cif_nif(m.group(1)):
+            validos.setdefault(re.sub(r"[-\s]", "", m.group(1)).upper(), m.group(1))
+    return next(iter(validos.values())) if len(validos) == 1 else ""
+
+
+def _proveedor(lineas: list[str], cif: str) -> str:
+    """
+    Heurística para el proveedor: la primera línea con forma jurídica (S.L., S.A.…)
+    o, si no hay, la línea anterior a la del CIF del proveedor.
+    """
+    for linea in lineas:
+        if PATRON_FORMA_JURIDICA.search(linea):
+            return linea
+    for i, linea in enumerate(lineas):
+        if cif and cif in linea and i > 0:
+            return lineas[i - 1]
+    return ""
+
+
+def _direccion(lineas: list[str], proveedor: str) -> str:
+    """La primera línea del emisor, tras la del proveedor, con forma de dirección (calle, C.P.…)."""
+    inicio = lineas.index(proveedor) + 1 if proveedor in lineas else 0
+    return next((l for l in lineas[inicio:] if PATRON_DIRECCION.search(l) and not PATRON_CIF.search(l)), "")
+
+
+def _cliente(bloque: list[str]) -> tuple[str, str]:
+    """
+    (nombre, CIF) del bloque del cliente: el texto tras la etiqueta o, si no
+    hay, la línea siguiente; y el único CIF/NIF válido del bloque.
+    """
+    nombre = ""
+    for i, linea in enumerate(bloque):
+        m = PATRON_CLIENTE.search(linea)
+        if not m:
+            continue
+        candidatos = [linea[m.end():].lstrip(" :.-\t").rstrip()] + [l.strip() for l in bloque[i + 1:i + 2]]
+        nombre = next((c for c in candidatos if re.search(r"[A-Za-z]{3}", c)
+                       and not PATRON_CIF.search(c)), "")
+        break
+    return nombre, _cif_emisor("\n".join(bloque))
+
+
+def extraer_campos_texto(texto: str) -> dict:
+    """
+    Extrae proveedor, CIF, dirección, cliente, nº de factura, fecha, total,
+    base, IVA y concepto del texto de la factura. Los campos no encontrados
+    quedan como cadena vacía. Proveedor, CIF y dirección se buscan fuera del
+    bloque del cliente.
+    """
+    emisor, bloque_cliente = _separar_bloques(texto)
+    lineas = [l.strip() for l in emisor if re.search(r"[A-Za-z]{3}", l)]
+    cif_texto = _cif_emisor("\n".join(emisor))
+    proveedor = _proveedor(lineas, cif_texto)
+    cliente, cif_cliente = _cliente(bloque_cliente)
+    # "Fecha de factura: 01/02/2024" también encaja con el patrón del número
+    numero = next(
+        (m for m in PATRON_NUMERO.finditer(texto) if not PATRON_SOLO_FECHA.fullmatch(m.group(1))), None
+    )
+    fecha = PATRON_FECHA.search(texto)
+    totales = [m.group(1) for m in PATRON_TOTAL.finditer(texto)]
+    base, iva, concepto = extraer_del_texto(texto)
+
+    return {
+        "proveedor": proveedor,
+        "cif": cif_texto,
+        "direccion": _direccion(lineas, proveedor),
+        "cliente": cliente,
+        "cif_cliente": cif_cliente,
+        "numero": numero.group(1) if numero else "",
+        "fecha": fecha.group(1) if fecha else "",
+        # Si hay varios "Total", el de la factura es el mayor
+        "total": max(totales, key=leer_importe) if totales else "",
+        "base": base,
+        "iva": iva,
+        "concepto": concepto,
+    }
+
+
+def es_fiable(campos: dict) -> bool:
+    """
+    True si están todos los campos obligatorios y pasan las validaciones:
+    CIF/NIF con control correcto, fecha real, total > 0 y, si hay base e IVA,
+    que Base + IVA cuadre con el total.
+    """
+    if not all(campos[c] for c in ("proveedor", "cif", "numero", "fecha", "total")):
+        return False
+    if not validar_cif_nif(campos["cif"]) or not fecha_valida(campos["fecha"]):
+        return False
+    total = leer_importe(campos["total"])
+    if total is None or total <= 0:
+        return False
+    if campos["base"] and campos["iva"]:
+        base, iva = leer_importe(campos["base"]), leer_importe(campos["iva"])
+        return base is not None and iva is not None and abs(base + iva - total) <= 0.02
+    return True
+
+
+def documento_desde_campos(texto: str, campos: dict):
+    """
+    Construye un Document con las mismas entidades que devolvería el
+    Invoice Processor, para que los scripts apliquen su mapeo habitual.
+    """
+    from google.cloud import documentai_v1 as documentai
+    entidad = documentai.Document.Entity
+    entidades = [
+        entidad(type_="supplier_name", mention_text=campos["proveedor"]),
+        entidad(type_="supplier_tax_id", mention_text=campos["cif"]),
+        entidad(type_="invoice_id", mention_text=campos["numero"]),
+        entidad(type_="invoice_date", mention_text=campos["fecha"]),
+        entidad(type_="total_amount", mention_text=campos["total"]),
+    ]
+    opcionales = (("supplier_address", "direccion"), ("customer_name", "cliente"),
+                  ("customer_tax_id", "cif_cliente"))
+    for tipo, campo in opcionales:
+        if campos[campo]:
+            entidades.append(entidad(type_=tipo, mention_text=campos[campo]))
+    if campos["base"]:
+        entidades.append(entidad(type_="net_amount", mention_text=campos["base"]))
+    if campos["iva"]:
+        entidades.append(entidad(type_="total_tax_amount", mention_text=campos["iva"]))
+    if campos["base"] or campos["iva"]:
+        entidades.append(entidad(type_="vat", properties=[
+            entidad(type_="vat/amount", mention_text=campos["base"]),
+            entidad(type_="vat/tax_amount", mention_text=campos["iva"]),
+        ]))
+    if campos["concepto"]:
+        entidades.append(entidad(type_="line_item", properties=[
+            entidad(type_="line_item/description", mention_text=campos["concepto"]),
+        ]))
+    return documentai.Document(text=texto, entities=entidades)
+
+
+class RutaLocal:
+    """
+    Intenta resolver cada factura con su capa de texto y lleva la cuenta de
+    cuántas se resolvieron en local y del tiempo de API ahorrado (estimado
+    con la latencia media de las llamadas reales de la misma ejecución).
+    """
+
+    def __init__(self):
+        self.locales = 0
+        self.llamadas_api = 0
+        self.segundos_api = 0.0
+        self._lock = threading.Lock()
+
+    def documento_local(self, content: bytes):
+        """Document construido en local, o None si hay que llamar a Document AI."""
+        texto = extraer_texto_pdf(content)
+        if len(texto.strip()) < MIN_CARACTERES_TEXTO:
+            return None
+        campos = extraer_campos_texto(texto)
+        if not es_fiable(campos):
+            return None
+        with self._lock:
+            self.locales += 1
+        return documento_desde_campos(texto, campos)
+
+    def registrar_llamada(self, segundos: float) -> None:
+        with self._lock:
+            self.llamadas_api += 1
+            self.segundos_api += segundos
+
+    def medir(self, ocr):
+        """Envuelve la función de OCR para medir la latencia de la API."""
+        def ocr_medido(content):
+            inicio = time.perf_counter()
+            doc = ocr(content)
+            self.registrar_llamada(time.perf_counter() - inicio)
+            return doc
+        return ocr_medido
+
+    def segundos_ahorrados(self) -> float:
+        latencia = self.segundos_api / self.llamadas_api if self.llamadas_api else LATENCIA_API_ESTIMADA
+        return self.locales * latencia
+
+    def resumen(self) -> str:
+        return (f"Ruta local (texto del PDF): {self.locales} facturas sin Document AI, "
+                f"~{self.segundos_ahorrados():.1f} s ahorrados")